@@ -0,0 +1,61 @@
+"""
+Times excel_utils.load_excel on a generated workbook and reports the peak memory of the process.
+Run it on two commits to compare the loaders, the workbook is generated once:
+    python bench/bench_load_excel.py /tmp/bench_load_excel.xlsx
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+import openpyxl
+
+from etm_converter.excel_utils import load_excel
+
+
+def generate_workbook(filename: str, sheets: int, rows: int, columns: int) -> None:
+    """
+    Writes a workbook of text and number cells, the text values are stored as shared strings.
+    :param filename: The workbook file name
+    :param sheets: The number of sheets
+    :param rows: The number of rows of each sheet
+    :param columns: The number of columns of each sheet
+    """
+    rnd = random.Random(1)
+    words = [f'value {i}' for i in range(5000)]
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_index in range(sheets):
+        sheet = workbook.create_sheet(f'Sheet{sheet_index}')
+        for _ in range(rows):
+            sheet.append([rnd.choice(words) if rnd.random() < 0.7 else rnd.randint(0, 99999)
+                          for _ in range(columns)])
+    workbook.save(filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of excel_utils.load_excel')
+    parser.add_argument('workbook', help='workbook to load, generated if it does not exist')
+    parser.add_argument('--columns', type=int, default=30)
+    parser.add_argument('--rows', type=int, default=8000)
+    parser.add_argument('--sheets', type=int, default=6)
+    args = parser.parse_args()
+    if not os.path.exists(args.workbook):
+        generate_workbook(args.workbook, args.sheets, args.rows, args.columns)
+    start = time.perf_counter()
+    spread_sheet = load_excel(args.workbook)
+    cells = 0
+    for sheet_name in spread_sheet.sheet_names():
+        sheet = spread_sheet.sheet(sheet_name)
+        cells += sheet.rows * sheet.columns
+    if hasattr(spread_sheet, 'close'):
+        spread_sheet.close()
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{os.path.getsize(args.workbook) / 1e6:.1f} MB workbook, {cells} cells: {elapsed:.2f} s, '
+          f'peak RSS {peak:.0f} MB', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Times model._remove_duplicates, the collapse of the repeated validation values, on long values.
+    python bench/bench_remove_duplicates.py [--repeat N]
+"""
+import argparse
+import random
+import sys
+import timeit
+
+from etm_converter.model import _remove_duplicates
+
+
+def _values() -> list[tuple[str, str]]:
+    rnd = random.Random(1)
+    fragment = '{"id": 12, "name": "value", "items": [1, 2, 3]},'
+    periodic = fragment * (100000 // len(fragment))
+    long_periodic = fragment * (400000 // len(fragment))
+    random_value = ''.join(rnd.choice('abcdefghij') for _ in range(400000))
+    # 720720 has 240 divisors, the value is periodic but for its last character
+    near_periodic = ('abcdefghijkl' * (720720 // 12))[:-1] + 'x'
+    return [('periodic json', periodic), ('periodic json', long_periodic), ('random', random_value),
+            ('near periodic', near_periodic)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time _remove_duplicates on long values')
+    parser.add_argument('--repeat', type=int, default=5, help='number of calls timed per value')
+    args = parser.parse_args()
+    for label, value in _values():
+        elapsed = min(timeit.repeat(lambda: _remove_duplicates(value), number=args.repeat, repeat=5)) / args.repeat
+        print(f'{len(value):>7} {label:<14} {elapsed * 1000:.2f} ms', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Times generate_feature on API tests whose request and response bodies are written inline in the feature.
+    python bench/bench_scenario_rendering.py [--tests N] [--repeat N]
+"""
+import argparse
+import sys
+import timeit
+
+from etm_converter import generator
+from etm_converter.generator import generate_feature, DefaultFeatureGenerator
+from etm_converter.model import APIScenario, APITest
+
+BODY_SIZES = (1024, 100 * 1024, 500 * 1024)
+
+
+def _api_tests(tests: int, body_size: int) -> list[APITest]:
+    body = ('{"name": "value", "text": "' + 'x' * body_size)[:body_size - 2] + '"}'
+    return [APITest((APIScenario(f'Scenario {i}', (('$.text', body),), body, 'header', 'post', '200', '/api/x',
+                                 (('$.id', 'id'),)),))
+            for i in range(tests)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the rendering of inline API scenarios')
+    parser.add_argument('--repeat', type=int, default=15, help='number of timed renderings of each feature')
+    parser.add_argument('--tests', type=int, default=40, help='number of API tests of the feature')
+    args = parser.parse_args()
+    # Keeps the request data inline whatever the feature size
+    generator.REQUESTS_MAX_SIZE = sys.maxsize
+    for body_size in BODY_SIZES:
+        sources = _api_tests(args.tests, body_size)
+        elapsed = min(timeit.repeat(lambda: generate_feature('Bench', sources, DefaultFeatureGenerator()),
+                                    number=1, repeat=args.repeat))
+        print(f'{body_size // 1024:>4} KB bodies: {elapsed * 1000:.1f} ms', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Times substitute_value on a corpus of typical cell values, mostly plain values with a few expressions.
+    python bench/bench_substitution.py
+"""
+import argparse
+import random
+import sys
+import timeit
+
+try:
+    from etm_converter.substitution import substitute_value
+except ImportError:
+    # Before the substitution engine
+    from etm_converter.converter_common import substitute_value
+
+EXPRESSIONS = ('~csharp(Guid.NewGuid().ToString())',
+               '~csharp(DateTime.Now.AddDays(3).AddYears(-1).ToString("MM/dd/yyyy"))',
+               '~csharp(DateTime.Today.ToString("yyyy"))',
+               '~csharp(return string.Format("201275{0}", new Random().Next(1000, 9999));)',
+               '~csharp("{abc}".Substring(2))',
+               '~string("hello")',
+               '~csharp(CultureInfo.CurrentCulture.TextInfo.ToTitleCase("{name}"))',
+               '~email')
+PLAIN_VALUES = ('John', 'Smith', '12345', '2020-01-01', 'true', 'ACTIVE', 'some longer description text of a field',
+                '{id}', 'Vehicle 1', 'N/A', '0.00', 'CA', 'https://example.com/api/v1/policy')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of substitute_value')
+    parser.add_argument('--plain-ratio', type=int, default=60, help='number of copies of the plain values')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    corpus = list(PLAIN_VALUES) * args.plain_ratio + list(EXPRESSIONS)
+    random.Random(1).shuffle(corpus)
+    elapsed = min(timeit.repeat(lambda: [substitute_value(value) for value in corpus], number=args.repeat, repeat=5))
+    print(f'{len(corpus)} values: {elapsed / args.repeat / len(corpus) * 1e9:.0f} ns per value', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,15 @@
 import json
 import re
 import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator
+from xml.parsers import expat
 
 import etm_converter.model as model
-from etm_converter.converter_common import create_parsing_context, parse_time, substitute_value, ParsingContext
+from etm_converter.converter_common import create_parsing_context, parse_time, substitute_value, ParsingContext, \
+    TAC_CREATE_KEYWORD, TAC_DATABASE_TEST, TAC_NONE, TAC_SHARED_STEP, TAC_WAIT, TAC_WEB_SERVICE
 from etm_converter.excel_utils import Sheet
+from etm_converter.workbook_cache import WorkbookCache
 
 # parameters for parsing database test
 PARAM_DB_CONNECTION_STRING = 'dbconnectionstring'
@@ -21,6 +26,7 @@ TYPE_JSON_CLOSING = 1
 TYPE_JSON_FIELD = 2
 
 JSON_FIELD_REGEXP = re.compile(r'"([A-Z])([^"]*)":')
+JSON_TEMPLATE_REGEXP = re.compile(r'([^:]*):\s*,$')
 RESPONSE_CODE_REGEXP = re.compile(r'response\s*code', re.IGNORECASE)
 
 
@@ -44,7 +50,9 @@ def _parse_create_keyword(parsing_context: ParsingContext,
         return None
 
 
-def _parse_get_input(parameters: dict[str, str], request_sheet: Sheet) -> tuple[tuple[str, str]] | None:
+def _parse_get_input(parsing_context: ParsingContext,
+                     parameters: dict[str, str],
+                     request_sheet: Sheet) -> tuple[tuple[str, str]] | None:
     """
     Parses a get request sheet
     :param request_sheet: The sheet to parse
@@ -122,21 +130,41 @@ def _json_row_type(json_template: str) -> int:
     return TYPE_JSON_FIELD
 
 
-def _substitute_json_template(json_template: str, value: str) -> str:
-    template_regexp = re.compile('([^:]*):\\s*,$')
-    match = template_regexp.search(json_template)
+def _split_json_template(json_template: str) -> tuple[tuple[str, ...], bool]:
+    """
+    Splits a json field template around the places where the value goes.
+    :param json_template: The cleaned up template
+    :return: The fragments to join with the value and whether the quotes of the value must be escaped
+    """
+    match = JSON_TEMPLATE_REGEXP.search(json_template)
     if match:
-        return f'{match.group(1)}: {value},'
+        return (f'{match.group(1)}: ', ','), False
     if 'rawstring' in json_template:
-        return json_template.replace('rawstring', value)
+        return tuple(json_template.split('rawstring')), False
     if 'string' in json_template:
-        return json_template.replace('string', value.replace('"', '\\"'))
+        return tuple(json_template.split('string')), True
     if 'boolean' in json_template:
-        return json_template.replace('boolean', value)
+        return tuple(json_template.split('boolean')), False
     last_number_index = json_template.rfind('number')
     if last_number_index >= 0:
-        return json_template[:last_number_index] + value + json_template[last_number_index + len('number'):]
-    return json_template
+        return (json_template[:last_number_index], json_template[last_number_index + len('number'):]), False
+    return (json_template,), False
+
+
+@dataclass(frozen=True)
+class JsonTemplateRow:
+    """
+    A row of a json request template compiled once for all the scenario columns.
+    """
+    row_index: int
+    row_type: int
+    fragments: tuple[str, ...]
+    escape: bool
+
+    def fill(self, value: str) -> str:
+        if self.escape:
+            value = value.replace('"', '\\"')
+        return value.join(self.fragments)
 
 
 def _cleanup_json_template(json_template: str) -> str:
@@ -167,7 +195,29 @@ def _cleanup_json_template(json_template: str) -> str:
     return json_template
 
 
-def _parse_json_input(parameters: dict[str, str], request_sheet: Sheet) -> tuple[tuple[str, str]] | None:
+def _compile_json_template(request_sheet: Sheet, opening_row: int, closing_row: int) -> tuple[JsonTemplateRow, ...]:
+    """
+    Compiles the json template of a request sheet, column 0, once for all the scenario columns.
+    :param request_sheet: The request sheet
+    :param opening_row: The first row of the json request
+    :param closing_row: The last row of the json request
+    :return: The compiled non-empty template rows
+    """
+    plan = []
+    for row_index in range(opening_row, closing_row + 1):
+        json_template = _cleanup_json_template(request_sheet.cell(row_index, 0))
+        if json_template:
+            row_type = _json_row_type(json_template)
+            if row_type != TYPE_JSON_FIELD:
+                plan.append(JsonTemplateRow(row_index, row_type, (json_template,), False))
+            else:
+                plan.append(JsonTemplateRow(row_index, row_type, *_split_json_template(json_template)))
+    return tuple(plan)
+
+
+def _parse_json_input(parsing_context: ParsingContext,
+                      parameters: dict[str, str],
+                      request_sheet: Sheet) -> tuple[tuple[str, str]] | None:
     """
     Parses a json request sheet
     :param request_sheet: The sheet to parse
@@ -178,23 +228,21 @@ def _parse_json_input(parameters: dict[str, str], request_sheet: Sheet) -> tuple
     if opening_row is None or closing_row is None:
         print(f'ERROR: Unable to delimit json request in sheet {request_sheet.name}', file=sys.stderr)
         return None
+    plan = _compile_json_template(request_sheet, opening_row, closing_row)
     invalid = False
     for column_index in range(1, request_sheet.columns):
         scenario_name = request_sheet.cell(0, column_index)
         if scenario_name:
             properties = []
             types = []
-            for row_index in range(opening_row, closing_row + 1):
-                json_template = _cleanup_json_template(request_sheet.cell(row_index, 0))
-                input_value = _cell_value(request_sheet.cell(row_index, column_index), True)
-                if json_template and input_value is not None:
-                    current_type = _json_row_type(json_template)
-                    types.append(current_type)
-                    if current_type != TYPE_JSON_FIELD:
-                        properties.append(json_template)
+            for template_row in plan:
+                input_value = _cell_value(request_sheet.cell(template_row.row_index, column_index), True)
+                if input_value is not None:
+                    types.append(template_row.row_type)
+                    if template_row.row_type != TYPE_JSON_FIELD:
+                        properties.append(template_row.fragments[0])
                     else:
-                        value = substitute_value(input_value)
-                        properties.append(_substitute_json_template(json_template, value))
+                        properties.append(template_row.fill(substitute_value(input_value)))
             for index in range(0, len(properties) - 1):
                 if (types[index] != TYPE_JSON_OPENING and types[index + 1] == TYPE_JSON_CLOSING):
                     properties[index] = properties[index].rstrip(',')
@@ -244,20 +292,62 @@ def _clean_tag(tag: str) -> str:
     return tag.replace('{', '').replace('}', '') if tag else tag
 
 
-def _parse_xml_element(request_sheet: Sheet, row_index: int, column_index: int) -> str | None:
-    input_value = _cell_value(request_sheet.cell(row_index, column_index), True)
-    if input_value is None:
-        return None
-    start_tag = _clean_tag(request_sheet.cell(row_index, 0))
-    end_tag = _clean_tag(request_sheet.cell(row_index, 1))
-    if end_tag is None or end_tag == '':
-        return start_tag
-    return start_tag + substitute_value(input_value) + end_tag
+@dataclass(frozen=True)
+class XmlTemplateRow:
+    """
+    A row of a xml request template, with its tags cleaned once for all the scenario columns.
+    """
+    row_index: int
+    start_tag: str | None
+    end_tag: str | None
+
+    def fill(self, input_value: str) -> str | None:
+        if self.end_tag is None or self.end_tag == '':
+            return self.start_tag
+        return self.start_tag + substitute_value(input_value) + self.end_tag
 
 
-def _parse_xml_input(parameters: dict[str, str], request_sheet: Sheet) -> tuple[tuple[str, str]] | None:
+def _compile_xml_template(request_sheet: Sheet, opening_row: int, closing_row: int) -> tuple[XmlTemplateRow, ...]:
+    """
+    Compiles the xml template of a request sheet, columns 0 and 1, once for all the scenario columns.
+    :param request_sheet: The request sheet
+    :param opening_row: The first row of the xml request
+    :param closing_row: The last row of the xml request
+    :return: The compiled template rows
+    """
+    return tuple(XmlTemplateRow(row_index,
+                                _clean_tag(request_sheet.cell(row_index, 0)),
+                                _clean_tag(request_sheet.cell(row_index, 1)))
+                 for row_index in range(opening_row, closing_row + 1))
+
+
+def _check_xml_body(properties: list[str], row_indexes: list[int]) -> tuple[int, str] | None:
+    """
+    Checks that a xml request body is well-formed with a streaming expat parser fed one row at a time.
+    :param properties: The lines of the body
+    :param row_indexes: The request sheet row of each line
+    :return: None if the body is well-formed or else the row of the error and the error message
+    """
+    line_rows = []
+    for row_index, tag in zip(row_indexes, properties):
+        line_rows.extend([row_index] * (tag.count('\n') + 1))
+    parser = expat.ParserCreate()
+    try:
+        for tag in properties:
+            parser.Parse(tag + '\n', False)
+        parser.Parse('', True)
+    except expat.ExpatError as e:
+        line_index = min(e.lineno, len(line_rows)) - 1
+        return line_rows[line_index] if line_index >= 0 else None, expat.errors.messages[e.code]
+    return None
+
+
+def _parse_xml_input(parsing_context: ParsingContext,
+                     parameters: dict[str, str],
+                     request_sheet: Sheet) -> tuple[tuple[str, str]] | None:
     """
     Parses a xml request sheet
+    :param parsing_context: The parsing context, with the optional well-formedness check of the bodies
     :param request_sheet: The sheet to parse
     :return: a tuple of pairs (scenario name, request body) or None in case of error
     """
@@ -266,20 +356,36 @@ def _parse_xml_input(parameters: dict[str, str], request_sheet: Sheet) -> tuple[
     if opening_row is None or closing_row is None:
         print(f'ERROR: Unable to delimit xml request in sheet {request_sheet.name}', file=sys.stderr)
         return None
+    plan = _compile_xml_template(request_sheet, opening_row, closing_row)
+    invalid = False
     for column_index in range(2, request_sheet.columns):
         scenario_name = request_sheet.cell(0, column_index)
         if scenario_name:
             properties = []
-            for row_index in range(opening_row, closing_row + 1):
-                tag = _parse_xml_element(request_sheet, row_index, column_index)
-                if tag is not None:
-                    properties.append(tag)
+            row_indexes = []
+            for template_row in plan:
+                input_value = _cell_value(request_sheet.cell(template_row.row_index, column_index), True)
+                if input_value is not None:
+                    tag = template_row.fill(input_value)
+                    if tag is not None:
+                        properties.append(tag)
+                        row_indexes.append(template_row.row_index)
+            if parsing_context.check_xml:
+                error = _check_xml_body(properties, row_indexes)
+                if error is not None:
+                    row_index, message = error
+                    row = row_index + 1 if row_index is not None else opening_row + 1
+                    print(f'ERROR: Malformed xml request in sheet {request_sheet.name} on column {column_index + 1} '
+                          f'row {row}: {message}', file=sys.stderr)
+                    invalid = True
             body = '\n'.join(properties)
             inputs.append((scenario_name.lower(), body))
         else:
             print(
                 f'WARNING: Missing scenario name in xml request in sheet {request_sheet.name} on column {column_index}',
                 file=sys.stderr)
+    if invalid:
+        return None
     if len(inputs) == 0:
         print(f'ERROR: No scenario found in sheet {request_sheet.name}', file=sys.stderr)
         return None
@@ -444,6 +550,19 @@ def _transform_scenarios(parsing_context: ParsingContext, scenarios: [model.APIS
     return scenarios
 
 
+def _parse_sheet(parsing_context: ParsingContext, key: tuple, parse: Callable[[], Any]) -> Any:
+    """
+    Parses a sheet at most once per workbook.
+    :param parsing_context: The parsing context holding the parse results
+    :param key: The sheet name and the parameters the result depends on
+    :param parse: The function parsing the sheet
+    :return: The parse result
+    """
+    if key not in parsing_context.parsed_sheets:
+        parsing_context.parsed_sheets[key] = parse()
+    return parsing_context.parsed_sheets[key]
+
+
 def parse_api_test(parsing_context: ParsingContext,
                    row_index: int) -> model.APITest | None:
     name = f'{row_index:0>2}'
@@ -463,9 +582,16 @@ def parse_api_test(parsing_context: ParsingContext,
             f'ERROR: Unknown request type found request sheet {parameters[model.PARAM_REQUEST_SHEET]}',
             file=sys.stderr)
         return None
-    inputs = INPUT_PARSERS[request_type](parameters, request_sheet)
-    outputs = _parse_output(validation_sheet) if validation_sheet else {}
-    variables = _parse_output(get_sheet) if get_sheet else {}
+    input_key = (request_type, request_sheet.name)
+    if request_type == 'get':
+        input_key += (parameters[model.PARAM_REQUEST_HEADER], parameters.get(model.PARAM_URL, None))
+    inputs = _parse_sheet(parsing_context, input_key,
+                          lambda: INPUT_PARSERS[request_type](parsing_context, parameters, request_sheet))
+    # The outputs and variables are copied as they are updated with the common sheet data
+    outputs = dict(_parse_sheet(parsing_context, ('output', validation_sheet.name),
+                                lambda: _parse_output(validation_sheet))) if validation_sheet else {}
+    variables = dict(_parse_sheet(parsing_context, ('output', get_sheet.name),
+                                  lambda: _parse_output(get_sheet))) if get_sheet else {}
     _apply_common_sheet(parsing_context, parameters[model.PARAM_REQUEST_SHEET], inputs, outputs, variables)
     if inputs is None:
         return None
@@ -547,37 +673,62 @@ def _parse_wait_scenario(parsing_context: ParsingContext,
     return model.WaitScenario(time)
 
 
-TEST_PARSERS = {model.TAF_CREATE_KEYWORD: _parse_create_keyword,
-                model.TAF_DATABASE_TEST: parse_database_test,
-                model.TAF_SHARED_STEP: parse_shared_step,
-                model.TAF_WAIT: _parse_wait_scenario,
-                model.TAF_WEB_SERVICE: parse_api_test}
+TEST_PARSERS = {TAC_CREATE_KEYWORD: _parse_create_keyword,
+                TAC_DATABASE_TEST: parse_database_test,
+                TAC_SHARED_STEP: parse_shared_step,
+                TAC_WAIT: _parse_wait_scenario,
+                TAC_WEB_SERVICE: parse_api_test}
 
 
 def _parse_test(parsing_context: ParsingContext,
                 row_index: int) -> model.ScenarioSource | None:
-    testing_action = parsing_context.sheet.action(row_index).lower()
-    if testing_action in TEST_PARSERS.keys():
-        return TEST_PARSERS[testing_action](parsing_context, row_index)
+    test_parser = TEST_PARSERS.get(parsing_context.sheet.action_code(row_index))
+    if test_parser is not None:
+        return test_parser(parsing_context, row_index)
     else:
+        testing_action = parsing_context.sheet.action(row_index).lower()
         print(f'ERROR: Unrecognized testing action {testing_action} on row {row_index}', file=sys.stderr)
         return None
 
 
-def parse_file(filename: str, selector: str) -> tuple[model.ScenarioSource | None] | None:
+def iter_file(filename: str, selector: str,
+              cache: WorkbookCache | None = None,
+              check_xml: bool = False,
+              content: bytes | None = None) -> Iterator[model.ScenarioSource | None]:
     """
-    Parses the tests in the given workbook
+    Parses the tests in the given workbook one at a time, as they are consumed
     :param filename: The file name
     :param selector: The optional selector
-    :return: A tuple of ScenarioSource or None in case of error
+    :param cache: The optional workbook cache
+    :param check_xml: True to check that the xml request bodies are well-formed
+    :param content: The optional content of the workbook, filename is then only used in messages
+    :return: An iterator of ScenarioSource, None for a test that could not be parsed
     """
     try:
-        parsing_context = create_parsing_context(filename, selector)
-        tests = tuple(_parse_test(parsing_context, row_index)
-                      for row_index in range(1, parsing_context.sheet.rows())
-                      if parsing_context.sheet.action(row_index) and parsing_context.sheet.runnable(row_index))
-        return None if None in tests else tests
+        parsing_context = create_parsing_context(filename, selector, cache, check_xml, content)
+        try:
+            for row_index in range(1, parsing_context.sheet.rows()):
+                if parsing_context.sheet.action_code(row_index) != TAC_NONE \
+                        and parsing_context.sheet.runnable(row_index):
+                    yield _parse_test(parsing_context, row_index)
+        finally:
+            parsing_context.spread_sheet.close()
     except Exception as e:
         print(f'ERROR: Exception while parsing API test file: {filename}', file=sys.stderr)
         print(e, file=sys.stderr)
-        return None
+        yield None
+
+
+def parse_file(filename: str, selector: str,
+               cache: WorkbookCache | None = None,
+               check_xml: bool = False) -> tuple[model.ScenarioSource | None] | None:
+    """
+    Parses the tests in the given workbook
+    :param filename: The file name
+    :param selector: The optional selector
+    :param cache: The optional workbook cache
+    :param check_xml: True to check that the xml request bodies are well-formed
+    :return: A tuple of ScenarioSource or None in case of error
+    """
+    tests = tuple(iter_file(filename, selector, cache, check_xml))
+    return None if None in tests else tests
@@ -1,43 +1,161 @@
 import argparse
 import os
+import sys
+from functools import partial
+from pathlib import Path
 
 from etm_converter import utils
-from etm_converter.api_converter import parse_file
-from etm_converter.generator import feature_generator_factory, generate_feature
+from etm_converter.api_converter import iter_file
+from etm_converter.archive import convert_workbooks, input_feature_generator, is_archive, open_workbook_input
+from etm_converter.build_manifest import build_inputs_digest, file_digest, BuildManifest
+from etm_converter.converter import convert_api_workbook, convert_workbook_folder
+from etm_converter.excel_utils import LOADER_VERSION
+from etm_converter.generator import feature_generator_factory, save_feature, FeatureGenerator
+from etm_converter.request_reader import INDEXED_REQUEST_FILE_SUFFIX
+from etm_converter.substitution import load_substitution_rules, set_substitution_rules, substitution_statistics, \
+    BUILTIN_RULES, CacheStatistics, DEFAULT_SUBSTITUTION_CACHE_ENTRIES
+from etm_converter.watcher import watch_directory
+from etm_converter.workbook_cache import default_cache_dir, WorkbookCache
+
+
+def _convert_file(input_filename: str,
+                  output_path: str,
+                  selector: str,
+                  feature_generator: FeatureGenerator,
+                  cache: WorkbookCache | None,
+                  check_xml: bool,
+                  offload_threshold: int | None,
+                  dedup_requests: bool,
+                  indexed_requests: bool) -> bool:
+    """
+    Converts a workbook into its feature file and optional request file.
+    :param input_filename: The workbook file name
+    :param output_path: The output folder path
+    :param selector: The optional selector
+    :param feature_generator: The feature generator to use
+    :param cache: The optional workbook cache
+    :param check_xml: True to check that the xml request bodies are well-formed
+    :param offload_threshold: The optional size over which request data is written to the request file
+    :param dedup_requests: True to write each distinct payload of the request file only once
+    :param indexed_requests: True to write the request file in the indexed format
+    :return: True if both output files were written
+    """
+    file_name = os.path.basename(input_filename)[:-5]
+    request_suffix = INDEXED_REQUEST_FILE_SUFFIX if indexed_requests else '.req'
+    return save_feature(os.path.join(output_path, file_name + '.feature'),
+                        os.path.join(output_path, file_name + request_suffix),
+                        file_name, iter_file(input_filename, selector, cache, check_xml), feature_generator,
+                        offload_threshold, dedup_requests, indexed_requests)
 
 
 def api_main():
     parser = argparse.ArgumentParser(prog='etcapi',
                                      description='Generate Gherkin test scenarios from excel files',
-                                     usage='etcapi input_dir output_dir [selector]')
-    parser.add_argument('input_dir')
-    parser.add_argument('output_dir')
+                                     usage='etcapi [--jobs JOBS] [--no-cache] [--cache-dir CACHE_DIR] [--check-xml] '
+                                           '[--dedup-requests] [--incremental] [--indexed-requests] '
+                                           '[--offload-threshold OFFLOAD_THRESHOLD] '
+                                           '[--substitution-rules SUBSTITUTION_RULES] '
+                                           '[--substitution-cache-size SUBSTITUTION_CACHE_SIZE] [--watch] '
+                                           'input_dir output_dir [selector]')
+    parser.add_argument('input_dir', help='folder of the workbooks, or zip archive of the workbooks')
+    parser.add_argument('output_dir', help='folder of the features, or zip archive written with the features')
     parser.add_argument('selector', nargs='?')
+    parser.add_argument('--cache-dir', default=default_cache_dir(), help='directory of the parsed workbook cache')
+    parser.add_argument('--check-xml', action='store_true', help='check that the xml request bodies are well-formed')
+    parser.add_argument('--dedup-requests', action='store_true',
+                        help='write each distinct request body, variable set or validation set of the request file '
+                             'once')
+    parser.add_argument('--incremental', action='store_true',
+                        help='leave the workbooks in place and only convert those whose inputs changed since the '
+                             'previous incremental conversion')
+    parser.add_argument('--indexed-requests', action='store_true',
+                        help=f'write the request files in the memory-mappable indexed format, as '
+                             f'{INDEXED_REQUEST_FILE_SUFFIX} files')
+    parser.add_argument('--jobs', type=int, default=1, help='number of workbooks converted in parallel')
+    parser.add_argument('--no-cache', action='store_true', help='parse every workbook with openpyxl')
+    parser.add_argument('--offload-threshold', type=int,
+                        help='size over which a request body, variable set or validation set of a scenario is '
+                             'written to the request file, instead of all or none of them depending on the feature '
+                             'size')
+    parser.add_argument('--substitution-cache-size', type=int, default=DEFAULT_SUBSTITUTION_CACHE_ENTRIES,
+                        help='maximum number of memoised substituted values, 0 disables the memo')
+    parser.add_argument('--substitution-rules', help='json file of site specific value substitution rules')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and convert the workbooks written in input_dir, implies --incremental')
     args = parser.parse_args()
+    substitution_rules = BUILTIN_RULES
+    if args.substitution_rules:
+        substitution_rules = load_substitution_rules(args.substitution_rules)
+        if substitution_rules is None:
+            return
+    substitution_cache_size = args.substitution_cache_size
+    set_substitution_rules(substitution_rules, substitution_cache_size)
     input_path = args.input_dir
     output_path = args.output_dir
     selector = args.selector
-    success_path = os.path.join(input_path, 'success')
+    cache = None if args.no_cache else WorkbookCache(args.cache_dir, LOADER_VERSION)
+    if is_archive(input_path) or is_archive(output_path):
+        if args.incremental or args.watch:
+            print('ERROR: --incremental and --watch need an input folder and an output folder', file=sys.stderr)
+            return
+        with open_workbook_input(input_path) as workbooks:
+            feature_generator = input_feature_generator(workbooks, input_path, selector)
+            convert = partial(convert_api_workbook, selector=selector, feature_generator=feature_generator,
+                              cache=cache, check_xml=args.check_xml, offload_threshold=args.offload_threshold,
+                              dedup_requests=args.dedup_requests, indexed_requests=args.indexed_requests)
+            statistics = convert_workbooks(workbooks, input_path, output_path, convert, feature_generator,
+                                           INDEXED_REQUEST_FILE_SUFFIX if args.indexed_requests else '.req',
+                                           args.jobs, substitution_rules, substitution_cache_size)
+        feature_generator.report()
+        statistics += substitution_statistics()
+        print(statistics.summary(), file=sys.stderr)
+        return
     os.makedirs(output_path, exist_ok=True)
-    os.makedirs(success_path, exist_ok=True)
-    paths = utils.scan_dir(input_path, '*.xlsx')
-    paths.sort()
     feature_generator = feature_generator_factory(input_path, selector)
-    for path in paths:
-        input_filename = os.path.join(input_path, path.name)
-        print(f'Parsing file {input_filename}')
-        sources = parse_file(input_filename, selector)
-        if sources is not None:
-            file_name = path.name[:-5]
-            feature, requests = generate_feature(file_name, sources, feature_generator)
-            utils.save_file(os.path.join(output_path, file_name + '.feature'), feature)
-            request_file = os.path.join(output_path, file_name + '.req')
-            if requests is None:
-                utils.delete_file(request_file)
-            else:
-                utils.save_file(request_file, requests)
-            utils.move_file(input_filename, os.path.join(success_path, path.name))
+    request_suffix = INDEXED_REQUEST_FILE_SUFFIX if args.indexed_requests else '.req'
+    manifest = None
+    if args.incremental or args.watch:
+        # The workbooks stay in place, those whose outputs are up to date are skipped
+        manifest = BuildManifest.load(output_path)
+    else:
+        os.makedirs(os.path.join(input_path, 'success'), exist_ok=True)
+    statistics = CacheStatistics()
+
+    def convert(paths: list[Path], jobs: int) -> None:
+        nonlocal statistics
+        inputs_digest = None
+        if manifest is not None:
+            inputs_digest = build_inputs_digest(file_digest(os.path.join(input_path, 'Suite.json')), selector,
+                                                args.offload_threshold, args.dedup_requests, args.indexed_requests,
+                                                file_digest(args.substitution_rules) if args.substitution_rules
+                                                else None)
+        convert_file = partial(_convert_file, output_path=output_path, selector=selector,
+                               feature_generator=feature_generator, cache=cache, check_xml=args.check_xml,
+                               offload_threshold=args.offload_threshold, dedup_requests=args.dedup_requests,
+                               indexed_requests=args.indexed_requests)
+        statistics += convert_workbook_folder(paths, input_path, convert_file, feature_generator, request_suffix, jobs,
+                                              substitution_rules, substitution_cache_size, manifest, inputs_digest)
+
+    convert(sorted(utils.scan_dir(input_path, '*.xlsx')), args.jobs)
     feature_generator.report()
+    statistics += substitution_statistics()
+    print(statistics.summary(), file=sys.stderr)
+    if args.watch:
+        def changed(names: set[str] | None) -> None:
+            nonlocal feature_generator
+            if names is None or 'Suite.json' in names:
+                # The suite is part of the inputs of every workbook
+                feature_generator = feature_generator_factory(input_path, selector)
+                names = None
+            for workbook_name in manifest.remove_deleted(input_path):
+                print(f'Removed outputs of deleted file {os.path.join(input_path, workbook_name)}')
+            paths = sorted(utils.scan_dir(input_path, '*.xlsx'))
+            if names is not None:
+                paths = [path for path in paths if path.name in names]
+            convert([path for path in paths if not path.name.startswith('~$')], 1)
+            sys.stdout.flush()
+
+        watch_directory(input_path, changed)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,294 @@
+import abc
+import os
+import sys
+import zipfile
+from pathlib import Path
+from typing import Callable
+
+from etm_converter import utils
+from etm_converter.converter import convert_in_order, Conversion
+from etm_converter.generator import feature_generator_factory, FeatureGenerator, SAPIFeatureGenerator
+from etm_converter.substitution import CacheStatistics, SubstitutionRule
+
+ARCHIVE_SUFFIX = '.zip'
+
+# Converts the content of a workbook given its name without extension, None if it can not be converted
+WorkbookConverter = Callable[[str, bytes], Conversion | None]
+
+
+def is_archive(path: str) -> bool:
+    return path.lower().endswith(ARCHIVE_SUFFIX)
+
+
+class WorkbookInput(abc.ABC):
+    """
+    The workbooks to convert, in an input folder or at the root of an input archive.
+    """
+
+    def __enter__(self) -> 'WorkbookInput':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @abc.abstractmethod
+    def names(self) -> list[str]:
+        """
+        :return: The sorted file names of the workbooks
+        """
+        pass
+
+    @abc.abstractmethod
+    def read(self, name: str) -> bytes | None:
+        """
+        Reads a file of the input.
+        :param name: The file name
+        :return: The file content, None if there is no such file
+        """
+        pass
+
+    @abc.abstractmethod
+    def converted(self, name: str) -> None:
+        """
+        Records that a workbook was converted.
+        :param name: The workbook file name
+        """
+        pass
+
+    def close(self) -> None:
+        # Nothing to release by default
+        pass
+
+
+class FolderInput(WorkbookInput):
+    """
+    The workbooks of an input folder, moved to its success folder once converted.
+    """
+
+    def __init__(self, input_path: str):
+        self.input_path = input_path
+        self.success_path = os.path.join(input_path, 'success')
+        os.makedirs(self.success_path, exist_ok=True)
+
+    def names(self) -> list[str]:
+        return sorted(path.name for path in utils.scan_dir(self.input_path, '*.xlsx'))
+
+    def read(self, name: str) -> bytes | None:
+        try:
+            return Path(self.input_path, name).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def converted(self, name: str) -> None:
+        utils.move_file(os.path.join(self.input_path, name), os.path.join(self.success_path, name))
+
+
+class ArchiveInput(WorkbookInput):
+    """
+    The workbooks at the root of a zip archive, read without extracting them. The archive is left untouched.
+    """
+
+    def __init__(self, archive_filename: str):
+        self.archive_filename = archive_filename
+        self.archive = zipfile.ZipFile(archive_filename)
+
+    def names(self) -> list[str]:
+        names = []
+        for info in self.archive.infolist():
+            if info.is_dir() or not info.filename.endswith('.xlsx'):
+                continue
+            if '/' in info.filename:
+                print(f'WARNING: Skipping {info.filename}, only the workbooks at the root of {self.archive_filename} '
+                      f'are converted', file=sys.stderr)
+            else:
+                names.append(info.filename)
+        return sorted(names)
+
+    def read(self, name: str) -> bytes | None:
+        try:
+            return self.archive.read(name)
+        except KeyError:
+            return None
+
+    def converted(self, name: str) -> None:
+        # The archive is an input only
+        pass
+
+    def close(self) -> None:
+        self.archive.close()
+
+
+def open_workbook_input(input_path: str) -> WorkbookInput:
+    return ArchiveInput(input_path) if is_archive(input_path) else FolderInput(input_path)
+
+
+class FeatureOutput(abc.ABC):
+    """
+    The feature and request files generated from the workbooks, in an output folder or in an output archive.
+    The files keep the same names in both.
+    """
+
+    def __enter__(self) -> 'FeatureOutput':
+        return self
+
+    def __exit__(self, exc_type, *_) -> None:
+        self.close(exc_type is None)
+
+    @abc.abstractmethod
+    def write(self, file_name: str, request_suffix: str, conversion: Conversion) -> None:
+        """
+        Writes the files generated from a workbook.
+        :param file_name: The workbook file name without extension
+        :param request_suffix: The extension of the request file
+        :param conversion: The generated files
+        """
+        pass
+
+    def close(self, complete: bool) -> None:
+        """
+        :param complete: False to discard the output, when the conversion was interrupted
+        """
+        pass
+
+
+class FolderOutput(FeatureOutput):
+    """
+    Writes the files in a folder like save_feature: an unchanged file is not rewritten and a request file that is no
+    longer generated is deleted.
+    """
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        os.makedirs(output_path, exist_ok=True)
+
+    def _save(self, file_name: str, content: str | bytes) -> None:
+        filename = os.path.join(self.output_path, file_name)
+        temp_filename = filename + '.tmp'
+        try:
+            if isinstance(content, bytes):
+                Path(temp_filename).write_bytes(content)
+            else:
+                with open(temp_filename, 'w', encoding='UTF-8') as file:
+                    file.write(content)
+            utils.replace_file(temp_filename, filename)
+        finally:
+            utils.delete_file(temp_filename)
+
+    def write(self, file_name: str, request_suffix: str, conversion: Conversion) -> None:
+        self._save(file_name + '.feature', conversion.feature)
+        if conversion.requests is None:
+            utils.delete_file(os.path.join(self.output_path, file_name + request_suffix))
+        else:
+            self._save(file_name + request_suffix, conversion.requests)
+
+
+class ArchiveOutput(FeatureOutput):
+    """
+    Writes the files in a zip archive as they are generated.
+    The archive is written to a temporary file that replaces the previous archive once complete.
+    """
+
+    def __init__(self, archive_filename: str):
+        self.archive_filename = archive_filename
+        self.temp_filename = archive_filename + '.tmp'
+        os.makedirs(os.path.dirname(archive_filename) or '.', exist_ok=True)
+        self.archive = zipfile.ZipFile(self.temp_filename, 'w', zipfile.ZIP_DEFLATED)
+
+    def write(self, file_name: str, request_suffix: str, conversion: Conversion) -> None:
+        self.archive.writestr(file_name + '.feature', conversion.feature)
+        if conversion.requests is not None:
+            self.archive.writestr(file_name + request_suffix, conversion.requests)
+
+    def close(self, complete: bool) -> None:
+        try:
+            self.archive.close()
+            if complete:
+                os.replace(self.temp_filename, self.archive_filename)
+        finally:
+            utils.delete_file(self.temp_filename)
+
+
+def open_feature_output(output_path: str) -> FeatureOutput:
+    return ArchiveOutput(output_path) if is_archive(output_path) else FolderOutput(output_path)
+
+
+def input_feature_generator(workbooks: WorkbookInput, input_path: str, selector: str) -> FeatureGenerator:
+    """
+    Creates the FeatureGenerator of an input folder or archive.
+    :param workbooks: The input
+    :param input_path: The input folder or archive path
+    :param selector: The selector
+    :return: The feature generator to use
+    """
+    if isinstance(workbooks, ArchiveInput) and selector and 'sapi' in selector.lower():
+        suite = workbooks.read('Suite.json')
+        if suite is None:
+            raise FileNotFoundError(f'No Suite.json in {input_path}')
+        return SAPIFeatureGenerator(input_path, suite.decode('UTF-8'))
+    return feature_generator_factory(input_path, selector)
+
+
+class _InputConverter:
+    """
+    Reads a workbook from the input and converts it, in the current process or in the worker processes.
+    """
+
+    def __init__(self, input_path: str, convert: WorkbookConverter, workbooks: WorkbookInput | None):
+        """
+        :param input_path: The input folder or archive path
+        :param convert: Converts a workbook
+        :param workbooks: The input, None to open it at the first conversion. Each worker process opens the input,
+        forked workers must not share the position of the input archive.
+        """
+        self.input_path = input_path
+        self.convert = convert
+        self.workbooks = workbooks
+
+    def __call__(self, name: str) -> Conversion | None:
+        if self.workbooks is None:
+            self.workbooks = open_workbook_input(self.input_path)
+        return self.convert(name[:-5], self.workbooks.read(name))
+
+
+def convert_workbooks(workbooks: WorkbookInput,
+                      input_path: str,
+                      output_path: str,
+                      convert: WorkbookConverter,
+                      feature_generator: FeatureGenerator,
+                      request_suffix: str,
+                      jobs: int,
+                      substitution_rules: tuple[SubstitutionRule, ...],
+                      substitution_cache_size: int,
+                      excluded: tuple[str, ...] = ()) -> CacheStatistics:
+    """
+    Converts the workbooks of an input folder or archive into an output folder or archive.
+    Each workbook is read from the input and its files are written to the output in order, one workbook at a time,
+    without extracting the input archive or staging the output archive in a folder.
+    :param workbooks: The input
+    :param input_path: The input folder or archive path
+    :param output_path: The output folder or archive path
+    :param convert: Converts a workbook, it must be picklable for a parallel conversion
+    :param feature_generator: The feature generator used by convert
+    :param request_suffix: The extension of the request files
+    :param jobs: The number of workbooks converted in parallel
+    :param substitution_rules: The substitution rules of the worker processes
+    :param substitution_cache_size: The substitution cache size of the worker processes
+    :param excluded: The names of the workbooks of the input that are not converted
+    :return: The substitution cache statistics of the worker processes
+    """
+    names = [name for name in workbooks.names() if name not in excluded]
+    with open_feature_output(output_path) as output:
+
+        def conversion_done(name: str, conversion: Conversion | None) -> None:
+            if conversion is None:
+                print(f'An error happened while parsing {name}', file=sys.stderr)
+                return
+            feature_generator.mark_used(name[:-5])
+            output.write(name[:-5], request_suffix, conversion)
+            workbooks.converted(name)
+
+        statistics = convert_in_order(names, _InputConverter(input_path, convert, None if jobs > 1 else workbooks),
+                                      jobs, substitution_rules, substitution_cache_size,
+                                      lambda name: print(f'Parsing file {os.path.join(input_path, name)}'),
+                                      conversion_done)
+    return statistics
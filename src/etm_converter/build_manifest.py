@@ -0,0 +1,137 @@
+import functools
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+MANIFEST_FILENAME = '.etm_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def file_digest(filename: str) -> str | None:
+    """
+    Computes the hash of a file content.
+    :param filename: The file name
+    :return: The hexadecimal sha256 of the file, None if the file does not exist
+    """
+    try:
+        return hashlib.sha256(Path(filename).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+@functools.cache
+def converter_digest() -> str:
+    """
+    Computes the hash of the converter source code, so that any change of the converter invalidates the outputs.
+    The modules are hashed once per process, a process runs the code it loaded at its start.
+    :return: The hexadecimal sha256 of the modules of the package
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob('*.py')):
+        digest.update(path.name.encode('UTF-8'))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def build_inputs_digest(*inputs: str | int | bool | None) -> str:
+    """
+    Computes the hash of the inputs shared by all the workbooks of a conversion.
+    :param inputs: The inputs, like the digests of the UI repository and Suite.json, the selector and the options
+    :return: The hexadecimal sha256 of the converter and the inputs
+    """
+    return hashlib.sha256(json.dumps([converter_digest(), *inputs]).encode('UTF-8')).hexdigest()
+
+
+@dataclass(frozen=True)
+class BuildManifest:
+    """
+    Record of the outputs generated from each workbook, keyed by the hash of everything the outputs depend on:
+    the workbook, the converter and the inputs shared by the workbooks of a conversion.
+    """
+    output_path: str
+    entries: dict[str, dict] = field(default_factory=dict)  # workbook name -> {'key': ..., 'outputs': [...]}
+
+    @staticmethod
+    def load(output_path: str) -> 'BuildManifest':
+        """
+        Loads the manifest of an output folder.
+        :param output_path: The output folder path
+        :return: The manifest, empty if there is none or if it can not be read
+        """
+        path = os.path.join(output_path, MANIFEST_FILENAME)
+        try:
+            with open(path, 'r', encoding='UTF-8') as file:
+                content = json.load(file)
+            if content.get('version') == MANIFEST_VERSION:
+                return BuildManifest(output_path, content['workbooks'])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f'WARNING: Discarding unreadable build manifest {path}: {e}', file=sys.stderr)
+        return BuildManifest(output_path)
+
+    def key(self, workbook_filename: str, inputs_digest: str) -> str:
+        """
+        Computes the build key of a workbook.
+        :param workbook_filename: The workbook file name
+        :param inputs_digest: The digest of the shared inputs returned by build_inputs_digest
+        :return: The build key
+        """
+        return hashlib.sha256(f'{file_digest(workbook_filename)}:{inputs_digest}'.encode('ascii')).hexdigest()
+
+    def is_up_to_date(self, workbook_name: str, key: str) -> bool:
+        """
+        Tells if the outputs of a workbook were generated with the given key and still exist.
+        :param workbook_name: The workbook file name, without folder
+        :param key: The build key of the workbook
+        :return: True if the workbook does not need to be converted
+        """
+        entry = self.entries.get(workbook_name)
+        return entry is not None and entry['key'] == key \
+            and all(os.path.exists(os.path.join(self.output_path, output)) for output in entry['outputs'])
+
+    def record(self, workbook_name: str, key: str, outputs: list[str]) -> None:
+        """
+        Records the outputs generated from a workbook.
+        :param workbook_name: The workbook file name, without folder
+        :param key: The build key of the workbook
+        :param outputs: The names of the output files that exist in the output folder
+        """
+        self.entries[workbook_name] = {
+            'key': key,
+            'outputs': [output for output in outputs if os.path.exists(os.path.join(self.output_path, output))]}
+
+    def forget(self, workbook_name: str) -> None:
+        self.entries.pop(workbook_name, None)
+
+    def remove_deleted(self, input_path: str) -> list[str]:
+        """
+        Deletes the outputs of the workbooks deleted or renamed since their conversion, and forgets those workbooks.
+        :param input_path: The input folder path
+        :return: The names of the workbooks whose outputs were deleted
+        """
+        workbook_names = [name for name in self.entries if not os.path.exists(os.path.join(input_path, name))]
+        for workbook_name in workbook_names:
+            for output in self.entries.pop(workbook_name)['outputs']:
+                Path(self.output_path, output).unlink(True)
+        return workbook_names
+
+    def save(self, input_path: str) -> None:
+        """
+        Writes the manifest in the output folder, without the entries of the workbooks deleted or renamed since their
+        conversion.
+        :param input_path: The input folder path
+        """
+        for workbook_name in [name for name in self.entries if not os.path.exists(os.path.join(input_path, name))]:
+            del self.entries[workbook_name]
+        fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=self.output_path)
+        try:
+            with os.fdopen(fd, 'w', encoding='UTF-8') as file:
+                json.dump({'version': MANIFEST_VERSION, 'workbooks': self.entries}, file, indent=1, sort_keys=True)
+            os.replace(temp_name, os.path.join(self.output_path, MANIFEST_FILENAME))
+        finally:
+            Path(temp_name).unlink(True)
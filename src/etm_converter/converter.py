@@ -0,0 +1,305 @@
+import gc
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, TypeVar
+
+from etm_converter import api_converter, ui_converter, utils
+from etm_converter.build_manifest import BuildManifest
+from etm_converter.converter_common import UIObject
+from etm_converter.generator import write_feature, DefaultFeatureGenerator, FeatureGenerator, IndexedRequestWriter, \
+    TextRequestWriter
+from etm_converter.model import ScenarioSource
+from etm_converter.substitution import set_substitution_rules, substitution_statistics, CacheStatistics, \
+    SubstitutionRule
+from etm_converter.workbook_cache import WorkbookCache
+
+# The content of a workbook, or a binary stream positioned at its start
+Workbook = bytes | BinaryIO
+
+Item = TypeVar('Item')
+Result = TypeVar('Result')
+
+# Converter of a worker process, set by _init_worker
+_worker_state = {}
+
+
+@dataclass(frozen=True)
+class Conversion:
+    """
+    The content of the files generated from a workbook, the same as the files written by etcapi and etcui.
+    """
+    feature: str
+    requests: str | bytes | None  # The text or indexed request file, None when no request data is offloaded
+
+
+def _workbook_content(workbook: Workbook) -> bytes:
+    return workbook.read() if hasattr(workbook, 'read') else bytes(workbook)
+
+
+def _convert(name: str,
+             sources: Iterable[ScenarioSource | None],
+             feature_generator: FeatureGenerator | None,
+             offload_threshold: int | None,
+             dedup_requests: bool,
+             indexed_requests: bool) -> Conversion | None:
+    feature_file = io.StringIO()
+    if feature_generator is None:
+        feature_generator = DefaultFeatureGenerator()
+    if indexed_requests:
+        requests = IndexedRequestWriter(dedup_requests, io.BytesIO())
+        offloaded = write_feature(name, sources, feature_generator, feature_file, requests, offload_threshold)
+        requests_content = None
+        if offloaded:
+            requests_file = io.BytesIO()
+            requests.finish(requests_file)
+            requests_content = requests_file.getvalue()
+    else:
+        requests_file = io.StringIO()
+        offloaded = write_feature(name, sources, feature_generator, feature_file,
+                                  TextRequestWriter(requests_file, dedup_requests), offload_threshold)
+        requests_content = requests_file.getvalue() + '\n' if offloaded else None
+    if offloaded is None:
+        return None
+    return Conversion(feature_file.getvalue() + '\n', requests_content)
+
+
+def load_ui_objects(workbook: Workbook,
+                    name: str = 'Objects',
+                    cache: WorkbookCache | None = None) -> dict[str, UIObject] | None:
+    """
+    Parses a UI objects workbook, the repository used by convert_ui_workbook.
+    :param workbook: The workbook content or stream
+    :param name: The workbook name used in messages
+    :param cache: The optional workbook cache, None to not touch the filesystem
+    :return: The map of Object names to UIObject, None in case of error
+    """
+    return ui_converter.parse_ui_objects(name + '.xlsx', cache, _workbook_content(workbook))
+
+
+def convert_api_workbook(name: str,
+                         workbook: Workbook,
+                         selector: str | None = None,
+                         feature_generator: FeatureGenerator | None = None,
+                         cache: WorkbookCache | None = None,
+                         check_xml: bool = False,
+                         offload_threshold: int | None = None,
+                         dedup_requests: bool = False,
+                         indexed_requests: bool = False) -> Conversion | None:
+    """
+    Converts an API test workbook in memory.
+    :param name: The workbook file name without extension, the feature name
+    :param workbook: The workbook content or stream
+    :param selector: The optional selector
+    :param feature_generator: The feature generator to use, for example a SAPIFeatureGenerator for the sapi selectors.
+    Features without tags by default.
+    :param cache: The optional workbook cache, None to not touch the filesystem
+    :param check_xml: True to check that the xml request bodies are well-formed
+    :param offload_threshold: The optional size over which request data is written to the request file
+    :param dedup_requests: True to write each distinct payload of the request file only once
+    :param indexed_requests: True to generate the request file in the indexed format, as bytes
+    :return: The generated files, None if the workbook can not be converted
+    """
+    sources = api_converter.iter_file(name + '.xlsx', selector, cache, check_xml, _workbook_content(workbook))
+    return _convert(name, sources, feature_generator, offload_threshold, dedup_requests, indexed_requests)
+
+
+def convert_ui_workbook(name: str,
+                        workbook: Workbook,
+                        ui_objects_map: dict[str, UIObject],
+                        selector: str | None = None,
+                        feature_generator: FeatureGenerator | None = None,
+                        cache: WorkbookCache | None = None,
+                        check_xml: bool = False,
+                        offload_threshold: int | None = None,
+                        dedup_requests: bool = False,
+                        indexed_requests: bool = False) -> Conversion | None:
+    """
+    Converts a UI test workbook in memory.
+    :param name: The workbook file name without extension, the feature name
+    :param workbook: The workbook content or stream
+    :param ui_objects_map: The map of Object names to UIObject, see load_ui_objects
+    :param selector: The optional selector
+    :param feature_generator: The feature generator to use, features without tags by default
+    :param cache: The optional workbook cache, None to not touch the filesystem
+    :param check_xml: True to check that the xml request bodies are well-formed
+    :param offload_threshold: The optional size over which request data is written to the request file
+    :param dedup_requests: True to write each distinct payload of the request file only once
+    :param indexed_requests: True to generate the request file in the indexed format, as bytes
+    :return: The generated files, None if the workbook can not be converted
+    """
+    sources = ui_converter.iter_file(name + '.xlsx', ui_objects_map, selector, cache, check_xml,
+                                     _workbook_content(workbook))
+    return _convert(name, sources, feature_generator, offload_threshold, dedup_requests, indexed_requests)
+
+
+def convert_api_workbooks(workbooks: Iterable[tuple[str, Workbook]],
+                          **options) -> Iterator[tuple[str, Conversion | None]]:
+    """
+    Converts API test workbooks in memory, one at a time as the results are consumed.
+    :param workbooks: The names, without extension, and the contents or streams of the workbooks
+    :param options: The options of convert_api_workbook
+    :return: An iterator of the names and generated files of the workbooks, None for a workbook that can not be
+    converted
+    """
+    for name, workbook in workbooks:
+        yield name, convert_api_workbook(name, workbook, **options)
+
+
+def convert_ui_workbooks(workbooks: Iterable[tuple[str, Workbook]],
+                         ui_objects_map: dict[str, UIObject],
+                         **options) -> Iterator[tuple[str, Conversion | None]]:
+    """
+    Converts UI test workbooks in memory, one at a time as the results are consumed.
+    :param workbooks: The names, without extension, and the contents or streams of the workbooks
+    :param ui_objects_map: The map of Object names to UIObject shared by the workbooks, see load_ui_objects
+    :param options: The options of convert_ui_workbook
+    :return: An iterator of the names and generated files of the workbooks, None for a workbook that can not be
+    converted
+    """
+    for name, workbook in workbooks:
+        yield name, convert_ui_workbook(name, workbook, ui_objects_map, **options)
+
+
+def _init_worker(convert: Callable,
+                 substitution_rules: tuple[SubstitutionRule, ...],
+                 substitution_cache_size: int) -> None:
+    set_substitution_rules(substitution_rules, substitution_cache_size)
+    _worker_state['convert'] = convert
+
+
+def run_in_worker(*args) -> tuple[Any, CacheStatistics]:
+    """
+    Runs the converter of a worker process created by create_worker_pool.
+    :param args: The arguments of the converter
+    :return: The result of the converter and the substitution cache statistics of the run
+    """
+    statistics = substitution_statistics()
+    result = _worker_state['convert'](*args)
+    return result, substitution_statistics() - statistics
+
+
+def create_worker_pool(jobs: int,
+                       convert: Callable,
+                       substitution_rules: tuple[SubstitutionRule, ...],
+                       substitution_cache_size: int) -> ProcessPoolExecutor:
+    """
+    Creates the process pool of a parallel conversion, whose tasks are submitted as run_in_worker.
+    When fork is available the converter is set before the workers are forked, so that they share it, and the UI
+    object repository or Suite.json it holds, copy-on-write. The workers are forked before returning and the parent
+    keeps no reference to the converter. Otherwise, it is pickled once to each worker by the initializer.
+    :param jobs: The number of worker processes
+    :param convert: The converter run by the workers
+    :param substitution_rules: The substitution rules of the worker processes
+    :param substitution_cache_size: The substitution cache size of the worker processes
+    :return: The process pool
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        _init_worker(convert, substitution_rules, substitution_cache_size)
+        # Keeps the garbage collector of the workers from touching, and thus copying, the shared objects
+        gc.freeze()
+        try:
+            workers = ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('fork'))
+            # The first task forks all the workers, a fork pool does not start workers later
+            workers.submit(int).result()
+        finally:
+            # The parent may outlive the converter, in watch mode and in the server
+            gc.unfreeze()
+            _worker_state.clear()
+        return workers
+    return ProcessPoolExecutor(jobs, initializer=_init_worker,
+                               initargs=(convert, substitution_rules, substitution_cache_size))
+
+
+def convert_in_order(items: list[Item],
+                     convert: Callable[[Item], Result],
+                     jobs: int,
+                     substitution_rules: tuple[SubstitutionRule, ...],
+                     substitution_cache_size: int,
+                     started: Callable[[Item], None],
+                     done: Callable[[Item, Result], None]) -> CacheStatistics:
+    """
+    Converts items in the current process, or in parallel in a worker pool, and handles the results in order.
+    :param items: The items to convert
+    :param convert: Converts an item, it must be picklable for a parallel conversion
+    :param jobs: The number of items converted in parallel
+    :param substitution_rules: The substitution rules of the worker processes
+    :param substitution_cache_size: The substitution cache size of the worker processes
+    :param started: Called with each item before its result is handled, before its conversion in the current process
+    :param done: Called with each item and its result, in the order of the items
+    :return: The substitution cache statistics of the worker processes
+    """
+    statistics = CacheStatistics()
+    if jobs > 1:
+        with create_worker_pool(jobs, convert, substitution_rules, substitution_cache_size) as workers:
+            for item, (result, worker_statistics) in zip(items, workers.map(run_in_worker, items)):
+                started(item)
+                statistics += worker_statistics
+                done(item, result)
+    else:
+        for item in items:
+            started(item)
+            done(item, convert(item))
+    return statistics
+
+
+def convert_workbook_folder(paths: list[Path],
+                            input_path: str,
+                            convert: Callable[[str], bool],
+                            feature_generator: FeatureGenerator,
+                            request_suffix: str,
+                            jobs: int,
+                            substitution_rules: tuple[SubstitutionRule, ...],
+                            substitution_cache_size: int,
+                            manifest: BuildManifest | None = None,
+                            inputs_digest: str | None = None) -> CacheStatistics:
+    """
+    Converts workbooks of an input folder, the output files being written by convert.
+    Without manifest a converted workbook is moved to the success folder of the input folder. With a manifest the
+    workbooks stay in place, those whose outputs are up to date are skipped and the conversions are recorded.
+    :param paths: The workbooks to convert
+    :param input_path: The input folder path
+    :param convert: Converts a workbook file name and returns True if its files were written, it must be picklable
+    for a parallel conversion
+    :param feature_generator: The feature generator used by convert
+    :param request_suffix: The extension of the request files
+    :param jobs: The number of workbooks converted in parallel
+    :param substitution_rules: The substitution rules of the worker processes
+    :param substitution_cache_size: The substitution cache size of the worker processes
+    :param manifest: The optional build manifest of an incremental conversion, saved once the workbooks are converted
+    without the workbooks that no longer exist
+    :param inputs_digest: The digest of the inputs shared by the workbooks, with a manifest
+    :return: The substitution cache statistics of the worker processes
+    """
+    keys = {}
+    if manifest is not None:
+        keys = {path.name: manifest.key(os.path.join(input_path, path.name), inputs_digest) for path in paths}
+        for path in paths:
+            if manifest.is_up_to_date(path.name, keys[path.name]):
+                print(f'Up to date file {os.path.join(input_path, path.name)}')
+                feature_generator.mark_used(path.name[:-5])
+        paths = [path for path in paths if not manifest.is_up_to_date(path.name, keys[path.name])]
+    success_path = os.path.join(input_path, 'success')
+
+    def conversion_done(input_filename: str, converted: bool) -> None:
+        name = os.path.basename(input_filename)
+        if converted:
+            # Also records the conversions of the worker processes
+            feature_generator.mark_used(name[:-5])
+        if manifest is not None:
+            if converted:
+                manifest.record(name, keys[name], [name[:-5] + '.feature', name[:-5] + request_suffix])
+            else:
+                manifest.forget(name)
+        elif converted:
+            utils.move_file(input_filename, os.path.join(success_path, name))
+
+    statistics = convert_in_order([os.path.join(input_path, path.name) for path in paths], convert, jobs,
+                                  substitution_rules, substitution_cache_size,
+                                  lambda input_filename: print(f'Parsing file {input_filename}'), conversion_done)
+    if manifest is not None:
+        manifest.save(input_path)
+    return statistics
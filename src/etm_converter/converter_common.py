@@ -1,22 +1,12 @@
-import re
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Any
 
 from etm_converter.excel_utils import load_excel, Sheet, SpreadSheet
+from etm_converter.substitution import set_substitution_scope, substitute_value
+from etm_converter.workbook_cache import WorkbookCache
 
 DEFAULT_WAIT_IN_SECONDS = 2
-# regexp for substitution of values in api tests and create keyword actions
-GUID_REGEXP = re.compile(r'~csharp\(\s*"?\s*Guid.NewGuid\(\).ToString\(\)\s*"?\s*\)', re.IGNORECASE)
-NOW_REGEXP = re.compile(r'~csharp\(\s*DateTime.(Now|Today)(.*)ToString\("(.*)"\)\)', re.IGNORECASE)
-PHONE_REGEXP = re.compile(r'~csharp\(return string.Format\(.*201275.*new Random\(\).Next\(1000\s*,\s*9999\)\);\)',
-                          re.IGNORECASE)
-STRING_REGEXP = re.compile(r'^~string\("(.*)"\)$', re.IGNORECASE)
-SUBSTRING1_REGEXP = re.compile(r'~csharp\(\s*"({[^{}]*})".substring\(\s*(\d+)\s*\)\)', re.IGNORECASE)
-SUBSTRING2_REGEXP = re.compile(r'~csharp\(\s*"({[^{}]*})".substring\(\s*(\d+)\s*,\s*(\d+)\s*\)\)', re.IGNORECASE)
-TO_TITLE_CASE_REGEXP = re.compile(
-    r'~csharp\(\s*CultureInfo\.CurrentCulture\.TextInfo\.ToTitleCase\(\s*"({[^{}]*})"\s*\)\s*\)\s*$',
-    re.IGNORECASE)
-
 CO_MODE = 'mode'
 CO_TEMPLATE = 'template'
 CO_TYPE = 'type'
@@ -31,6 +21,77 @@ THN_TEST_ACTION = 'testingactionfunctionality'
 THN_TEST_CASE_NAME = 'testcasename'
 THN_TIME_OUT = 'timeout'
 
+TAF_ACTION = 'action'
+TAF_CLOSE_ALL = 'closeallbrowsers'
+TAF_COMPARE_INT = 'compareint'
+TAF_CREATE_KEYWORD = 'createkeyword'
+TAF_DATABASE_TEST = 'databasetest'
+TAF_DATA_ENTRY = 'enterdata'
+TAF_DATA_ENTRY_CUSTOM = 'enterdatacustom'
+TAF_GET_OBJECT_DATA = 'getobjectdata'
+TAF_LAUNCH_AUT = 'launchaut'
+TAF_OBJECT_ENABLED = 'objectenabled'
+TAF_OBJECT_EXIST = 'objectexists'
+TAF_OBJECT_HIDDEN = 'objecthidden'
+TAF_OBJECT_NOT_ENABLED = 'objectnotenabled'
+TAF_OBJECT_NOT_EXIST = 'objectnotexists'
+TAF_OBJECT_NOT_HIDDEN = 'objectnothidden'
+TAF_SHARED_STEP = 'sharedstep'
+TAF_TAKE_SCREENSHOT = 'takescreenshot'
+TAF_VALIDATION = 'validatedata'
+TAF_WAIT = 'wait'
+TAF_WAIT_FOR_OBJECT = 'waitforobject'
+TAF_WEB_SERVICE = 'xmlwebservicetest'
+
+# codes of the testing actions, TAC_NONE for a blank action and TAC_UNKNOWN for an unrecognized one
+TAC_NONE = 0
+TAC_UNKNOWN = 1
+TAC_ACTION = 2
+TAC_CLOSE_ALL = 3
+TAC_COMPARE_INT = 4
+TAC_CREATE_KEYWORD = 5
+TAC_DATABASE_TEST = 6
+TAC_DATA_ENTRY = 7
+TAC_DATA_ENTRY_CUSTOM = 8
+TAC_GET_OBJECT_DATA = 9
+TAC_LAUNCH_AUT = 10
+TAC_OBJECT_ENABLED = 11
+TAC_OBJECT_EXIST = 12
+TAC_OBJECT_HIDDEN = 13
+TAC_OBJECT_NOT_ENABLED = 14
+TAC_OBJECT_NOT_EXIST = 15
+TAC_OBJECT_NOT_HIDDEN = 16
+TAC_SHARED_STEP = 17
+TAC_TAKE_SCREENSHOT = 18
+TAC_VALIDATION = 19
+TAC_WAIT = 20
+TAC_WAIT_FOR_OBJECT = 21
+TAC_WEB_SERVICE = 22
+
+TESTING_ACTION_CODES = {TAF_ACTION: TAC_ACTION,
+                        TAF_CLOSE_ALL: TAC_CLOSE_ALL,
+                        TAF_COMPARE_INT: TAC_COMPARE_INT,
+                        TAF_CREATE_KEYWORD: TAC_CREATE_KEYWORD,
+                        TAF_DATABASE_TEST: TAC_DATABASE_TEST,
+                        TAF_DATA_ENTRY: TAC_DATA_ENTRY,
+                        TAF_DATA_ENTRY_CUSTOM: TAC_DATA_ENTRY_CUSTOM,
+                        TAF_GET_OBJECT_DATA: TAC_GET_OBJECT_DATA,
+                        TAF_LAUNCH_AUT: TAC_LAUNCH_AUT,
+                        TAF_OBJECT_ENABLED: TAC_OBJECT_ENABLED,
+                        TAF_OBJECT_EXIST: TAC_OBJECT_EXIST,
+                        TAF_OBJECT_HIDDEN: TAC_OBJECT_HIDDEN,
+                        TAF_OBJECT_NOT_ENABLED: TAC_OBJECT_NOT_ENABLED,
+                        TAF_OBJECT_NOT_EXIST: TAC_OBJECT_NOT_EXIST,
+                        TAF_OBJECT_NOT_HIDDEN: TAC_OBJECT_NOT_HIDDEN,
+                        TAF_SHARED_STEP: TAC_SHARED_STEP,
+                        TAF_TAKE_SCREENSHOT: TAC_TAKE_SCREENSHOT,
+                        TAF_VALIDATION: TAC_VALIDATION,
+                        TAF_WAIT: TAC_WAIT,
+                        TAF_WAIT_FOR_OBJECT: TAC_WAIT_FOR_OBJECT,
+                        TAF_WEB_SERVICE: TAC_WEB_SERVICE}
+# flag of the runnable rows in the row classes of a TestDataSheet
+RUNNABLE_FLAG = 0x80
+
 TEST_COLUMN_NAMES_SET = {THN_RUN_TYPE, THN_ENV, THN_OBJECT_NAME_1, THN_TEST_ACTION, THN_TEST_CASE_NAME, THN_TIME_OUT}
 
 UIO_BROWSER_TITLE = 'browsertitle'
@@ -58,54 +119,74 @@ UIO_COLUMN_NAMES_SET = {UIO_BROWSER_TITLE, UIO_BROWSER_URL, UIO_CLASS_NAME,
 class CommonSheet:
     header_map: dict[str, int]
     sheet: Sheet
+    scenario_columns: dict[str, int]  # lower case scenario name -> column index
+    template_rows: dict[str, tuple[tuple[int, str, bool]]]  # lower case template -> (row, expression, is variable)
+    values: dict[tuple[int, int], str] = field(default_factory=dict)  # substituted values by (row, column)
+
+    def _value(self, row_index: int, column_index: int, value: str) -> str:
+        key = (row_index, column_index)
+        substituted = self.values.get(key)
+        if substituted is None:
+            substituted = substitute_value(value)
+            self.values[key] = substituted
+        return substituted
 
     def get_data(self, template: str, scenario_name: str) -> tuple[tuple[tuple[str, str]], tuple[tuple[str, str]]]:
-        template = template.lower()
-        scenario_name = scenario_name.lower()
-        scenario_column = None
-        for column_index in range(0, self.sheet.columns):
-            header = self.sheet.cell(0, column_index)
-            if header and scenario_name == header.lower():
-                scenario_column = column_index
-                break
+        scenario_column = self.scenario_columns.get(scenario_name.lower())
         if scenario_column is None:
             return ((), ())
         outputs = []
         variables = []
-        for row_index in range(1, self.sheet.rows):
-            current_template = self.sheet.cell(row_index, self.header_map[CO_TEMPLATE])
-            if current_template and template == current_template.lower():
-                expression = self.sheet.cell(row_index, self.header_map[CO_TYPE])
-                value = self.sheet.cell(row_index, scenario_column)
-                if expression and value is not None:
-                    new_pair = (expression, substitute_value(value))
-                    mode = self.sheet.cell(row_index, self.header_map[CO_MODE])
-                    if mode and 'get' == mode.lower():
-                        variables.append(new_pair)
-                    else:
-                        outputs.append(new_pair)
+        for row_index, expression, is_variable in self.template_rows.get(template.lower(), ()):
+            value = self.sheet.cell(row_index, scenario_column)
+            if value is not None:
+                new_pair = (expression, self._value(row_index, scenario_column, value))
+                if is_variable:
+                    variables.append(new_pair)
+                else:
+                    outputs.append(new_pair)
         return (tuple(outputs), tuple(variables))
 
 
 def create_common_sheet(sheet: Sheet) -> CommonSheet:
     header_map = {}
+    scenario_columns = {}
     for i in range(0, sheet.columns):
         cell_value = sheet.cell(0, i)
         if cell_value is not None:
             header = cell_value.lower()
             if header in COMMON_COLUMN_NAMES_SET:
                 header_map[header] = i
-    return CommonSheet(header_map, sheet)
+            elif header:
+                scenario_columns.setdefault(header, i)
+    # A missing column reads as empty cells, a sheet without Template or Type columns has no template rows
+    template_column = header_map.get(CO_TEMPLATE)
+    type_column = header_map.get(CO_TYPE)
+    mode_column = header_map.get(CO_MODE)
+    template_rows = {}
+    for row_index in range(1, sheet.rows if template_column is not None and type_column is not None else 0):
+        template = sheet.cell(row_index, template_column)
+        expression = sheet.cell(row_index, type_column)
+        if template and expression:
+            mode = sheet.cell(row_index, mode_column) if mode_column is not None else None
+            is_variable = bool(mode) and 'get' == mode.lower()
+            template_rows.setdefault(template.lower(), []).append((row_index, expression, is_variable))
+    return CommonSheet(header_map, sheet, scenario_columns,
+                       {template: tuple(rows) for template, rows in template_rows.items()})
 
 
 @dataclass(frozen=True)
 class TestDataSheet:
     header_map: dict[str, int]
     sheet: Sheet
+    row_classes: bytes  # action code of each row, with RUNNABLE_FLAG set for the runnable rows
 
     def action(self, row_index: int) -> str | None:
         return self.sheet.cell(row_index, self.header_map[THN_TEST_ACTION])
 
+    def action_code(self, row_index: int) -> int:
+        return self.row_classes[row_index] & ~RUNNABLE_FLAG
+
     def rows(self) -> int:
         return self.sheet.rows
 
@@ -127,16 +208,40 @@ class TestDataSheet:
         return self.sheet.cell(row_index, self.header_map[THN_OBJECT_NAME_1] + 1)
 
     def runnable(self, row_index: int) -> bool:
-        run_type = self.sheet.cell(row_index, self.header_map[THN_RUN_TYPE])
-        runnable = run_type and run_type.strip().lower() == 'g'
-        envs = self.sheet.cell(row_index, self.header_map[THN_ENV]) if THN_ENV in self.header_map else None
-        valid_env = envs is None or 'ut1' in envs.lower()
-        return runnable and valid_env
+        return self.row_classes[row_index] & RUNNABLE_FLAG != 0
 
     def test_case_name(self, row_index: int) -> str | None:
         return self.sheet.cell(row_index, self.header_map[THN_TEST_CASE_NAME])
 
 
+def _classify_test_data_rows(header_map: dict[str, int], sheet: Sheet) -> bytes:
+    """
+    Computes the action code and runnable flag of each row of a test data sheet.
+    A row is runnable when its run type is G and its environments, if any, include UT1.
+    The rows of a sheet without action column are unknown actions, reported by the parsers on the first runnable row,
+    and the rows of a sheet without run type column are not runnable.
+    :param header_map: The column indexes of the headers
+    :param sheet: The test data sheet
+    :return: The class of each row, the header row class is TAC_NONE
+    """
+    action_column = header_map.get(THN_TEST_ACTION)
+    run_type_column = header_map.get(THN_RUN_TYPE)
+    env_column = header_map.get(THN_ENV)
+    row_classes = bytearray(sheet.rows)
+    for row_index in range(1, sheet.rows):
+        if action_column is None:
+            code = TAC_UNKNOWN
+        else:
+            action = sheet.cell(row_index, action_column)
+            code = TESTING_ACTION_CODES.get(action.lower(), TAC_UNKNOWN) if action else TAC_NONE
+        run_type = sheet.cell(row_index, run_type_column) if run_type_column is not None else None
+        envs = sheet.cell(row_index, env_column) if env_column is not None else None
+        if run_type and run_type.strip().lower() == 'g' and (envs is None or 'ut1' in envs.lower()):
+            code |= RUNNABLE_FLAG
+        row_classes[row_index] = code
+    return bytes(row_classes)
+
+
 def create_test_data_sheet(sheet: Sheet) -> TestDataSheet:
     header_map = {}
     for i in range(0, sheet.columns):
@@ -145,7 +250,7 @@ def create_test_data_sheet(sheet: Sheet) -> TestDataSheet:
             header = cell_value.lower()
             if header in TEST_COLUMN_NAMES_SET:
                 header_map[header] = i
-    return TestDataSheet(header_map, sheet)
+    return TestDataSheet(header_map, sheet, _classify_test_data_rows(header_map, sheet))
 
 
 @dataclass(frozen=True)
@@ -154,15 +259,20 @@ class ParsingContext:
     common_sheet: CommonSheet
     sheet: TestDataSheet
     selector: str
+    check_xml: bool = False
+    parsed_sheets: dict[tuple, Any] = field(default_factory=dict)  # parse results of the sheets used by the tests
 
 
-def create_parsing_context(filename: str, selector: str) -> ParsingContext | None:
+def create_parsing_context(filename: str, selector: str, cache: WorkbookCache | None = None,
+                           check_xml: bool = False, content: bytes | None = None) -> ParsingContext | None:
     print(f'Parsing Test file: {filename}', file=sys.stderr)
-    spread_sheet = load_excel(filename)
+    set_substitution_scope(selector)
+    spread_sheet = load_excel(filename, cache, content)
     try:
         test_data = spread_sheet.sheet('TestData')
     except KeyError:
         print(f'No TestData sheet found in file {filename}', file=sys.stderr)
+        spread_sheet.close()
         return None
     sheet = create_test_data_sheet(test_data)
     try:
@@ -170,7 +280,7 @@ def create_parsing_context(filename: str, selector: str) -> ParsingContext | Non
     except KeyError:
         common = None
     common_sheet = create_common_sheet(common) if common else None
-    return ParsingContext(spread_sheet, common_sheet, sheet, selector)
+    return ParsingContext(spread_sheet, common_sheet, sheet, selector, check_xml)
 
 
 @dataclass(frozen=True)
@@ -260,67 +370,3 @@ def parse_time(time_string: str) -> int:
         return int(time_string)
     except ValueError:
         return DEFAULT_WAIT_IN_SECONDS
-
-
-def substitute_value(value: str | None) -> str | None:
-    """
-    Substitution of values for api tests and create keyword actions
-    1. Add the ~concat[[....]] around values containing potential concatenation.
-    2. Generate ~guid for csharp guid function
-    3. Check for substring functions given in csharp
-    4. Substitute the ~string("...") expressions
-    5. Substitute the value of ~email
-    :param value: The value to process
-    :return: The processed value.
-    """
-    if value is None:
-        return None
-    lower = value.lower()
-    if 'text(now()' in lower:
-        return f'~concat[[{value}]]'
-    match = NOW_REGEXP.search(value)
-    if match:
-        adders = match.group(2)
-        now_expr = '~now' \
-                   + _parse_now('AddYears', 'y', adders) \
-                   + _parse_now('AddMonths', 'm', adders) \
-                   + _parse_now('AddDays', 'd', adders) \
-                   + '{' + match.group(3) + '}'
-        return re.sub(NOW_REGEXP, now_expr, value)
-    match = PHONE_REGEXP.search(value)
-    if match:
-        phone = '201275~random{1000}'
-        return re.sub(PHONE_REGEXP, phone, value)
-    match = GUID_REGEXP.search(value)
-    if match:
-        return '~guid'
-    match = SUBSTRING1_REGEXP.search(value)
-    if match:
-        exp = f'~substring({match.group(1)},{match.group(2)})'
-        return SUBSTRING1_REGEXP.sub(exp, value)
-    match = SUBSTRING2_REGEXP.search(value)
-    if match:
-        exp = f'~substring({match.group(1)},{match.group(2)},{match.group(3)})'
-        return SUBSTRING2_REGEXP.sub(exp, value)
-    match = STRING_REGEXP.search(value)
-    if match:
-        return match.group(1)
-    match = TO_TITLE_CASE_REGEXP.search(value)
-    if match:
-        return f'~toTitleCase({match.group(1)})'
-    if '~email' == lower:
-        return 'bitbucket@geico.com'
-    return value
-
-
-def _parse_now(group: str, suffix: str, value: str) -> str:
-    match = re.compile(group + r'\(\s*([^)]*)\s*\)').search(value)
-    if match:
-        try:
-            count = int(match.group(1))
-            if count == 0:
-                return ''
-            return ('+' if count > 0 else '') + str(count) + suffix
-        except ValueError:
-            return ''
-    return ''
@@ -62,6 +62,8 @@ def diff_main():
     spread_sheet2 = load_excel(args.file2)
     pre_process(spread_sheet2)
     diff(spread_sheet1, spread_sheet2)
+    spread_sheet1.close()
+    spread_sheet2.close()
 
 
 if __name__ == '__main__':
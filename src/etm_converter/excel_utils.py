@@ -1,9 +1,20 @@
 import sys
 from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO
 
 import openpyxl
-from openpyxl.cell.cell import Cell
-from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.workbook.workbook import Workbook
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
+
+from etm_converter.workbook_cache import WorkbookCache
+
+# A warning is printed when the declared dimension of a sheet exceeds FACTOR * actual + MARGIN
+DIMENSION_WARNING_FACTOR = 10
+DIMENSION_WARNING_MARGIN = 100
+# Version of the cells produced by the loader. It must be increased when they change to invalidate the workbook cache
+LOADER_VERSION = 1
 
 
 @dataclass(frozen=True)
@@ -20,83 +31,155 @@ class Sheet:
         self.cells[row_index][column_index] = value
 
 
+class WorkbookReader:
+    """
+    Opens a read only workbook the first time it is needed.
+    """
+
+    def __init__(self, source: str | BinaryIO):
+        self.source = source
+        self.workbook = None
+
+    def close(self) -> None:
+        if self.workbook is not None:
+            self.workbook.close()
+
+    def is_open(self) -> bool:
+        return self.workbook is not None
+
+    def open(self) -> Workbook:
+        if self.workbook is None:
+            self.workbook = openpyxl.load_workbook(self.source, read_only=True, data_only=True)
+        return self.workbook
+
+
 @dataclass(frozen=True)
 class SpreadSheet:
-    sheets: dict[str, Sheet]
+    sheets: dict[str, Sheet]  # The sheets loaded so far
+    titles: dict[str, str]  # sheet name -> worksheet title, for all the sheets of the workbook
+    reader: WorkbookReader  # The reader of the workbook the sheets are loaded from on demand
+    cache: WorkbookCache | None = None  # The cache to update when sheets were read from the workbook
+    cache_key: str | None = None
+
+    def close(self) -> None:
+        """
+        Closes the underlying workbook and reports the number of sheets that were never loaded.
+        The sheets read from the workbook are stored in the cache.
+        """
+        if self.cache is not None and self.reader.is_open():
+            cached_sheets = {sheet_name: (sheet.cells, sheet.columns, sheet.name, sheet.rows)
+                             for sheet_name, sheet in self.sheets.items()}
+            self.cache.store(self.cache_key, (self.titles, cached_sheets))
+        self.reader.close()
+        print(f'Sheets loaded: {len(self.sheets)}, never loaded: {self.unloaded_sheets()}', file=sys.stderr)
 
     def sheet(self, sheet_name: str) -> Sheet:
-        return self.sheets[sheet_name]
+        sheet = self.sheets.get(sheet_name)
+        if sheet is None:
+            title = self.titles[sheet_name]
+            work_sheet = self.reader.open()[title]
+            print(f'Sheet: {title}, Rows: {work_sheet.max_row}, Columns: {work_sheet.max_column}', file=sys.stderr)
+            sheet = _read_sheet(work_sheet, title)
+            self.sheets[sheet_name] = sheet
+        return sheet
 
     def sheet_names(self) -> tuple[str]:
-        return tuple(self.sheets.keys())
+        return tuple(self.titles.keys())
+
+    def unloaded_sheets(self) -> int:
+        return len(self.titles) - len(self.sheets)
 
 
-def _cell_value(cell: Cell) -> str | None:
-    if cell is None or cell.value is None:
+def _cell_value(value) -> str | None:
+    if value is None:
         return None
-    return str(cell.value).strip()
+    return str(value).strip()
 
 
-def _is_cell_empty(cell: Cell) -> bool:
-    value = _cell_value(cell)
+def _is_value_empty(value: str | None) -> bool:
     return value is None or value == '' or value.isspace()
 
 
-def _is_column_empty(sheet: Worksheet, last_row: int, column_index: int) -> bool:
-    for row_index in range(1, last_row + 1):
-        current_cell = sheet.cell(row_index, column_index)
-        if not _is_cell_empty(current_cell):
-            return False
-    return True
-
-
-def _is_row_empty(sheet: Worksheet, row_index: int) -> bool:
-    for col_index in range(1, sheet.max_column + 1):
-        current_cell = sheet.cell(row_index, col_index)
-        if not _is_cell_empty(current_cell):
-            return False
-    return True
-
-
-def _last_non_empty_column(sheet: Worksheet, last_row: int) -> int:
-    column_index = sheet.max_column
-    while column_index > 0 and _is_column_empty(sheet, last_row, column_index):
+def _last_non_empty_column(values: list[str | None]) -> int:
+    column_index = len(values)
+    while column_index > 0 and _is_value_empty(values[column_index - 1]):
         column_index = column_index - 1
     return column_index
 
 
-def _last_non_empty_row(sheet: Worksheet) -> int:
-    row_index = sheet.max_row
-    if row_index == 0:
-        return 0
-    while row_index > 0 and _is_row_empty(sheet, row_index):
-        row_index = row_index - 1
-    return row_index
+def _is_dimension_oversized(declared: int | None, actual: int) -> bool:
+    return declared is not None and declared > DIMENSION_WARNING_FACTOR * actual + DIMENSION_WARNING_MARGIN
 
 
-def load_excel(input_filename: str) -> SpreadSheet | None:
+def _read_sheet(work_sheet: ReadOnlyWorksheet, sheet_name: str) -> Sheet:
+    """
+    Reads a read only worksheet in a single pass.
+    The last used row and column are tracked while the rows are streamed, so the cost depends on the data
+    and not on the dimensions declared in the worksheet. Those are not reliable and are only used for the warning.
+    :param work_sheet: The worksheet to read
+    :param sheet_name: The sheet name
+    :return: The Sheet
+    """
+    declared_rows = work_sheet.max_row
+    declared_columns = work_sheet.max_column
+    work_sheet.reset_dimensions()
+    cells = []
+    pending = []
+    columns = 0
+    for row in work_sheet.iter_rows(values_only=True):
+        values = [_cell_value(value) for value in row]
+        last_column = _last_non_empty_column(values)
+        if last_column > 0:
+            cells.extend(pending)
+            pending.clear()
+            cells.append(values)
+            columns = max(columns, last_column)
+        else:
+            # Trailing empty rows are dropped, fully empty rows are only kept as a placeholder until then
+            pending.append(values if any(value is not None for value in values) else None)
+    rows = len(cells)
+    if _is_dimension_oversized(declared_rows, rows) or _is_dimension_oversized(declared_columns, columns):
+        print(f'WARNING: Sheet {sheet_name} declares {declared_rows} rows and {declared_columns} columns '
+              f'but contains data in {rows} rows and {columns} columns only', file=sys.stderr)
+    if rows == 0:
+        return Sheet([], 0, sheet_name, 0)
+    cells = [[None] * columns if values is None else values[:columns] + [None] * (columns - len(values))
+             for values in cells]
+    return Sheet(cells, columns, sheet_name, rows)
+
+
+def _load_cached_excel(input_filename: str, cache: WorkbookCache, content: bytes | None) -> SpreadSheet:
+    if content is None:
+        content = Path(input_filename).read_bytes()
+    cache_key = cache.key(content)
+    entry = cache.load(cache_key)
+    reader = WorkbookReader(BytesIO(content))
+    if entry is None:
+        titles = {sheet_name.strip(): sheet_name for sheet_name in reader.open().sheetnames}
+        return SpreadSheet({}, titles, reader, cache, cache_key)
+    print(f'Workbook cache hit: {input_filename}', file=sys.stderr)
+    titles, cached_sheets = entry
+    sheets = {sheet_name: Sheet(*fields) for sheet_name, fields in cached_sheets.items()}
+    return SpreadSheet(sheets, titles, reader, cache, cache_key)
+
+
+def load_excel(input_filename: str, cache: WorkbookCache | None = None,
+               content: bytes | None = None) -> SpreadSheet | None:
     """
-    Loads an Excel file into a spreadsheet
+    Loads an Excel file into a spreadsheet.
+    The sheets are read the first time they are requested, the SpreadSheet must be closed after use.
     :param input_filename: The name of the Excel file to read.
+    :param cache: The optional workbook cache. Sheets found in the cache are not read from the workbook.
+    :param content: The optional content of the workbook, input_filename is then only used in messages.
     :return: The SpreadSheet or None in case of error
     """
     print(f'Load Excel file: {input_filename}', file=sys.stderr)
     try:
-        sheets = {}
-        workbook = openpyxl.load_workbook(input_filename, data_only=True)
-        for sheet_name in workbook.sheetnames:
-            work_sheet = workbook[sheet_name]
-            print(f'Sheet: {sheet_name}, Rows: {work_sheet.max_row}, Columns: {work_sheet.max_column}', file=sys.stderr)
-            rows = _last_non_empty_row(work_sheet)
-            if rows > 0:
-                columns = _last_non_empty_column(work_sheet, rows)
-                cells = [[_cell_value(work_sheet.cell(row_index, column_index))
-                          for column_index in range(1, columns + 1)]
-                         for row_index in range(1, rows + 1)]
-                sheets[sheet_name.strip()] = Sheet(cells, columns, sheet_name, rows)
-            else:
-                sheets[sheet_name.strip()] = Sheet([], 0, sheet_name, 0)
-        return SpreadSheet(sheets)
+        if cache is not None:
+            return _load_cached_excel(input_filename, cache, content)
+        reader = WorkbookReader(input_filename if content is None else BytesIO(content))
+        titles = {sheet_name.strip(): sheet_name for sheet_name in reader.open().sheetnames}
+        return SpreadSheet({}, titles, reader)
     except Exception as e:
         print(e, file=sys.stderr)
         return None
@@ -1,11 +1,20 @@
 import abc
+import hashlib
+import io
 import json
 import os
+import shutil
 import sys
+import tempfile
+from typing import BinaryIO, Iterable, TextIO
 
-from etm_converter.model import APITest, ScenarioSource
+from etm_converter import utils
+from etm_converter.model import APITest, ScenarioSource, OFFLOAD_ALL, OFFLOAD_NONE
+from etm_converter.request_reader import key_hash, HEADER, INDEXED_REQUEST_FILE_MAGIC, SLOT
 
 REQUESTS_MAX_SIZE = 20480
+# Size in bytes of the content hash of the payloads in a deduplicated request file
+BLOB_DIGEST_SIZE = 16
 
 
 class FeatureGenerator(abc.ABC):
@@ -13,6 +22,14 @@ class FeatureGenerator(abc.ABC):
     def feature(self, feature_name: str) -> [str]:
         pass
 
+    @abc.abstractmethod
+    def mark_used(self, feature_name: str) -> None:
+        """
+        Records that the feature was generated, possibly by another copy of this generator in a worker process.
+        :param feature_name: The feature name.
+        """
+        pass
+
     @abc.abstractmethod
     def report(self) -> None:
         pass
@@ -23,6 +40,10 @@ class DefaultFeatureGenerator(FeatureGenerator):
     def feature(self, feature_name: str) -> [str]:
         return [f'Feature: {feature_name}', '']
 
+    def mark_used(self, feature_name: str) -> None:
+        # Nothing to record in default implementation
+        pass
+
     def report(self) -> None:
         # Nothing to report in default implementation
         pass
@@ -32,10 +53,15 @@ class SAPIFeatureGenerator(FeatureGenerator):
     test_cases: dict[str, tuple[str, list[str]]]
     unused_test_cases: dict[str, str]
 
-    def __init__(self, input_path: str):
-        with open(os.path.join(input_path, 'Suite.json'), 'r') as file:
-            lines = file.readlines()
-        json_body = '\n'.join(lines)
+    def __init__(self, input_path: str, json_body: str | None = None):
+        """
+        :param input_path: The input folder path, where Suite.json is read.
+        :param json_body: The optional content of Suite.json, read from input_path otherwise.
+        """
+        if json_body is None:
+            with open(os.path.join(input_path, 'Suite.json'), 'r') as file:
+                lines = file.readlines()
+            json_body = '\n'.join(lines)
         try:
             parsed_json = json.loads(json_body)
         except Exception as e:
@@ -54,8 +80,6 @@ class SAPIFeatureGenerator(FeatureGenerator):
     def feature(self, feature_name: str) -> [str]:
         if feature_name in self.test_cases:
             test_case_id, tags = self.test_cases[feature_name]
-            if test_case_id in self.unused_test_cases:
-                del (self.unused_test_cases[test_case_id])
             result = []
             for tag in tags:
                 result.append('@' + tag)
@@ -67,6 +91,12 @@ class SAPIFeatureGenerator(FeatureGenerator):
             return result
         return [f'Feature: {feature_name}', '', 'ETM Test Case Id Unknown', '']
 
+    def mark_used(self, feature_name: str) -> None:
+        if feature_name in self.test_cases:
+            test_case_id, _ = self.test_cases[feature_name]
+            # pop rather than del, the feature may be generated by several server threads at once
+            self.unused_test_cases.pop(test_case_id, None)
+
     def report(self) -> None:
         print('List of Test cases not found in the input', file=sys.stderr)
         for test_case_id, name in self.unused_test_cases.items():
@@ -85,27 +115,302 @@ def feature_generator_factory(input_path: str, selector: str) -> FeatureGenerato
     return DefaultFeatureGenerator()
 
 
+class RequestWriter(abc.ABC):
+    """
+    Writes the request data offloaded from the scenarios of a feature.
+    """
+
+    @abc.abstractmethod
+    def add(self, key: str, payload: tuple[str, ...]) -> None:
+        """
+        Writes the payload of a key.
+        :param key: The key, like ##REQUEST:<scenario name>
+        :param payload: The payload lines
+        """
+        pass
+
+
+class TextRequestWriter(RequestWriter):
+    """
+    Writes the request data as text, each key on a ##KEY:<key> line followed by its payload lines.
+    In a deduplicated request file each distinct payload is written once, as a ##BLOB:<hash> entry before its first
+    use, and the keys are followed by a ##REF:<hash> line instead of their payload.
+    """
+    requests_file: TextIO
+    separator: str
+    blobs: set[str] | None  # The hashes of the payloads already written, None if the requests are not deduplicated
+
+    def __init__(self, requests_file: TextIO, dedup_requests: bool = False):
+        self.requests_file = requests_file
+        self.separator = ''
+        self.blobs = set() if dedup_requests else None
+
+    def add(self, key: str, payload: tuple[str, ...]) -> None:
+        if self.blobs is None:
+            self._write(f'##KEY:{key}')
+            for line in payload:
+                self._write(line)
+        else:
+            content = '\n'.join(payload)
+            digest = hashlib.blake2b(content.encode('UTF-8'), digest_size=BLOB_DIGEST_SIZE).hexdigest()
+            if digest not in self.blobs:
+                self.blobs.add(digest)
+                self._write(f'##BLOB:{digest}')
+                self._write(content)
+            self._write(f'##KEY:{key}')
+            self._write(f'##REF:{digest}')
+
+    def _write(self, line: str) -> None:
+        self.requests_file.write(self.separator)
+        self.requests_file.write(line)
+        self.separator = '\n'
+
+
+class IndexedRequestWriter(RequestWriter):
+    """
+    Writes the request data in the indexed format read by request_reader.RequestReader.
+    The keys and payloads are written to a temporary data file as they come, finish() then writes the header and the
+    hash table of the keys followed by the data. When a key is added again, the last payload wins.
+    The owner closes data_file, a temporary file unless another stream is given.
+    """
+    data_file: BinaryIO
+    data_size: int
+    keys: dict[bytes, tuple[int, int, int]]  # key -> (key offset, payload offset, payload length) in the data
+    payloads: dict[bytes, tuple[int, int]] | None  # payload hash -> (offset, length), None if not deduplicated
+
+    def __init__(self, dedup_requests: bool = False, data_file: BinaryIO | None = None):
+        self.data_file = tempfile.TemporaryFile() if data_file is None else data_file
+        self.data_size = 0
+        self.keys = {}
+        self.payloads = {} if dedup_requests else None
+
+    def _write(self, content: bytes) -> int:
+        offset = self.data_size
+        self.data_file.write(content)
+        self.data_size += len(content)
+        return offset
+
+    def add(self, key: str, payload: tuple[str, ...]) -> None:
+        encoded_key = key.encode('UTF-8')
+        content = '\n'.join(payload).encode('UTF-8')
+        location = None
+        if self.payloads is not None:
+            digest = hashlib.blake2b(content, digest_size=BLOB_DIGEST_SIZE).digest()
+            location = self.payloads.get(digest)
+            if location is None:
+                location = self.payloads[digest] = (self._write(content), len(content))
+        if location is None:
+            location = (self._write(content), len(content))
+        self.keys[encoded_key] = (self._write(encoded_key),) + location
+
+    def finish(self, index_file: BinaryIO) -> None:
+        """
+        Writes the indexed request file.
+        :param index_file: The binary stream of the indexed request file
+        """
+        # A load factor of at most 3/4 keeps the linear probing short
+        slot_count = 2
+        while 3 * slot_count < 4 * len(self.keys) + 1:
+            slot_count *= 2
+        data_offset = HEADER.size + slot_count * SLOT.size
+        slots = [None] * slot_count
+        for encoded_key, (key_offset, payload_offset, payload_length) in self.keys.items():
+            hash_value = key_hash(encoded_key)
+            slot_index = hash_value & (slot_count - 1)
+            while slots[slot_index] is not None:
+                slot_index = (slot_index + 1) & (slot_count - 1)
+            slots[slot_index] = SLOT.pack(hash_value, data_offset + key_offset, data_offset + payload_offset,
+                                          len(encoded_key), payload_length)
+        empty_slot = SLOT.pack(0, 0, 0, 0, 0)
+        index_file.write(HEADER.pack(INDEXED_REQUEST_FILE_MAGIC, slot_count, len(self.keys), data_offset))
+        index_file.write(b''.join(empty_slot if slot is None else slot for slot in slots))
+        self.data_file.seek(0)
+        shutil.copyfileobj(self.data_file, index_file)
+
+
+class _FeatureWriter:
+    """
+    Writes the scenarios of a feature to a text stream as they are rendered, and their requests to a RequestWriter.
+    """
+    feature_file: TextIO
+    requests: RequestWriter
+    scenario_number: int
+    separator: str
+    requests_written: bool
+
+    def __init__(self, feature_file: TextIO, requests: RequestWriter):
+        self.feature_file = feature_file
+        self.requests = requests
+        self.scenario_number = 1
+        self.separator = ''
+        self.requests_written = False
+
+    def position(self) -> tuple[int, int, str]:
+        return self.feature_file.tell(), self.scenario_number, self.separator
+
+    def rewind(self, position: tuple[int, int, str]) -> None:
+        """
+        Discards what was written to the feature stream since the given position.
+        :param position: A position returned by position()
+        """
+        offset, self.scenario_number, self.separator = position
+        self.feature_file.seek(offset)
+        self.feature_file.truncate()
+
+    def write(self, source: ScenarioSource, offload_threshold: int) -> None:
+        for scenario in source.api_scenarios(offload_threshold, self.scenario_number):
+            self.feature_file.write(self.separator)
+            self.feature_file.write(scenario)
+            self.separator = '\n\n'
+            self.scenario_number = self.scenario_number + 1
+        if offload_threshold != OFFLOAD_NONE and isinstance(source, APITest):
+            for key, payload in source.request_entries(offload_threshold):
+                self.requests.add(key, payload)
+                self.requests_written = True
+
+
+def write_feature(feature_name: str,
+                  sources: Iterable[ScenarioSource | None],
+                  feature_generator: FeatureGenerator,
+                  feature_file: TextIO,
+                  requests: RequestWriter,
+                  offload_threshold: int | None = None) -> bool | None:
+    """
+    Writes the feature for the given scenario sources as they come, without keeping the whole feature in memory.
+    Without an offload threshold, all the request data goes to the request file when the API tests exceed
+    REQUESTS_MAX_SIZE, and none of it otherwise. This is only known once the size is crossed: until then the scenarios
+    are written inline and the sources from the first API test onwards are kept, when the size is crossed the feature
+    stream is rewound to the first API test and the kept sources are written again.
+    With an offload threshold, only the request bodies, variable sets and validation sets larger than it go to the
+    request file.
+    :param feature_name: The feature name.
+    :param sources: The scenario sources in the feature, None for a source that could not be parsed.
+    :param feature_generator: The feature generator to use.
+    :param feature_file: The seekable stream of the feature.
+    :param requests: The writer of the request data.
+    :param offload_threshold: The optional size over which request data is written to the request file.
+    :return: True if requests were written, None if a source could not be parsed.
+    """
+    feature_file.write('\n'.join(feature_generator.feature(feature_name)) + '\n')
+    offloaded = _write_sources(sources, _FeatureWriter(feature_file, requests), offload_threshold)
+    if offloaded is not None:
+        # Only a complete feature counts as generated, a workbook that fails to parse stays unused
+        feature_generator.mark_used(feature_name)
+    return offloaded
+
+
+def _write_sources(sources: Iterable[ScenarioSource | None],
+                   writer: _FeatureWriter,
+                   offload_threshold: int | None) -> bool | None:
+    sources = iter(sources)
+    if offload_threshold is not None:
+        for source in sources:
+            if source is None:
+                # Parses the remaining sources anyway to report all their errors
+                for _ in sources:
+                    pass
+                return None
+            writer.write(source, offload_threshold)
+        return writer.requests_written
+    size = 0
+    big_request = False
+    kept_sources = []
+    first_api_test = None
+    for source in sources:
+        if source is None:
+            # Parses the remaining sources anyway to report all their errors
+            for _ in sources:
+                pass
+            return None
+        if not big_request:
+            if isinstance(source, APITest):
+                if first_api_test is None:
+                    first_api_test = writer.position()
+                size += source.size()
+                if size > REQUESTS_MAX_SIZE:
+                    big_request = True
+                    writer.rewind(first_api_test)
+                    for kept_source in kept_sources:
+                        writer.write(kept_source, OFFLOAD_ALL)
+                    kept_sources = None
+            if first_api_test is not None and not big_request:
+                kept_sources.append(source)
+        writer.write(source, OFFLOAD_ALL if big_request else OFFLOAD_NONE)
+    return big_request
+
+
+def save_feature(feature_filename: str,
+                 request_filename: str,
+                 feature_name: str,
+                 sources: Iterable[ScenarioSource | None],
+                 feature_generator: FeatureGenerator,
+                 offload_threshold: int | None = None,
+                 dedup_requests: bool = False,
+                 indexed_requests: bool = False) -> bool:
+    """
+    Writes the feature file, and the request file when request data is offloaded, while the sources are parsed.
+    Both files are written to temporary files next to them and only replace the previous ones once complete, and
+    only if their content changed.
+    The request file is deleted when no request data is offloaded.
+    :param feature_filename: The feature file path.
+    :param request_filename: The request file path.
+    :param feature_name: The feature name.
+    :param sources: The scenario sources in the feature, None for a source that could not be parsed.
+    :param feature_generator: The feature generator to use.
+    :param offload_threshold: The optional size over which request data is written to the request file.
+    :param dedup_requests: True to write each distinct payload of the request file only once.
+    :param indexed_requests: True to write the request file in the indexed format instead of text.
+    :return: True if the files were written, False if a source could not be parsed.
+    """
+    feature_temp_filename = feature_filename + '.tmp'
+    request_temp_filename = request_filename + '.tmp'
+    try:
+        with open(feature_temp_filename, 'w', encoding='UTF-8') as feature_file:
+            if indexed_requests:
+                requests = IndexedRequestWriter(dedup_requests)
+                try:
+                    offloaded = write_feature(feature_name, sources, feature_generator, feature_file, requests,
+                                              offload_threshold)
+                    if offloaded:
+                        with open(request_temp_filename, 'wb') as requests_file:
+                            requests.finish(requests_file)
+                finally:
+                    requests.data_file.close()
+            else:
+                with open(request_temp_filename, 'w', encoding='UTF-8') as requests_file:
+                    offloaded = write_feature(feature_name, sources, feature_generator, feature_file,
+                                              TextRequestWriter(requests_file, dedup_requests), offload_threshold)
+                    requests_file.write('\n')
+            if offloaded is None:
+                return False
+            feature_file.write('\n')
+        utils.replace_file(feature_temp_filename, feature_filename)
+        if offloaded:
+            utils.replace_file(request_temp_filename, request_filename)
+        else:
+            utils.delete_file(request_filename)
+        return True
+    finally:
+        utils.delete_file(feature_temp_filename)
+        utils.delete_file(request_temp_filename)
+
+
 def generate_feature(feature_name: str,
-                     sources: tuple[ScenarioSource],
-                     feature_generator: FeatureGenerator) -> tuple[str, str | None]:
+                     sources: Iterable[ScenarioSource],
+                     feature_generator: FeatureGenerator,
+                     offload_threshold: int | None = None,
+                     dedup_requests: bool = False) -> tuple[str, str | None]:
     """
     Generates the content of a feature file for the given scenario sources
     :param feature_name: The feature name.
     :param sources: The scenario sources in the feature.
     :param feature_generator: The feature generator to use.
+    :param offload_threshold: The optional size over which request data is written to the request file.
+    :param dedup_requests: True to write each distinct payload of the request file only once.
     :return: A tuple containing the feature and the Optional request file.
     """
-    requests = []
-    feature_declaration = '\n'.join(feature_generator.feature(feature_name)) + '\n'
-    sections = []
-    size = sum(source.size() for source in sources if isinstance(source, APITest))
-    big_request = size > REQUESTS_MAX_SIZE
-    scenario_number = 1
-    for source in sources:
-        scenarios = source.api_scenarios(big_request)
-        for scenario in scenarios:
-            sections.append(scenario.replace('Scenario: ', f'Scenario: {scenario_number:0>4}_'))
-            scenario_number = scenario_number + 1
-        if big_request and isinstance(source, APITest):
-            requests.extend(source.request_data())
-    return feature_declaration + '\n\n'.join(sections), '\n'.join(requests) if big_request else None
+    feature_file = io.StringIO()
+    requests_file = io.StringIO()
+    offloaded = write_feature(feature_name, sources, feature_generator, feature_file,
+                              TextRequestWriter(requests_file, dedup_requests), offload_threshold)
+    return feature_file.getvalue(), requests_file.getvalue() if offloaded else None
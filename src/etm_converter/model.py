@@ -1,6 +1,7 @@
 import abc
 import re
-from dataclasses import dataclass
+import sys
+from dataclasses import dataclass, field
 from typing import Any
 
 from etm_converter.converter_common import UIObject
@@ -17,53 +18,65 @@ PARAM_VALIDATION_SHEET = 'ValidationSheet'
 RESPONSE_BODY_REGEXP = re.compile(r'^\s*response\s*body\s*$')
 XPATH_SUBST_REGEX = re.compile(r"^(.*)\|\|(.*)$", re.IGNORECASE)
 
-TAF_ACTION = 'action'
-TAF_CLOSE_ALL = 'closeallbrowsers'
-TAF_COMPARE_INT = 'compareint'
-TAF_CREATE_KEYWORD = 'createkeyword'
-TAF_DATABASE_TEST = 'databasetest'
-TAF_DATA_ENTRY = 'enterdata'
-TAF_DATA_ENTRY_CUSTOM = 'enterdatacustom'
-TAF_GET_OBJECT_DATA = 'getobjectdata'
-TAF_LAUNCH_AUT = 'launchaut'
-TAF_OBJECT_ENABLED = 'objectenabled'
-TAF_OBJECT_EXIST = 'objectexists'
-TAF_OBJECT_HIDDEN = 'objecthidden'
-TAF_OBJECT_NOT_ENABLED = 'objectnotenabled'
-TAF_OBJECT_NOT_EXIST = 'objectnotexists'
-TAF_OBJECT_NOT_HIDDEN = 'objectnothidden'
-TAF_SHARED_STEP = 'sharedstep'
-TAF_TAKE_SCREENSHOT = 'takescreenshot'
-TAF_VALIDATION = 'validatedata'
-TAF_WAIT = 'wait'
-TAF_WAIT_FOR_OBJECT = 'waitforobject'
-TAF_WEB_SERVICE = 'xmlwebservicetest'
+# Offload thresholds generating all the request data of the scenarios in the request file, or none of it
+OFFLOAD_ALL = -1
+OFFLOAD_NONE = sys.maxsize
+
+
+def _smallest_divisor(number: int) -> int:
+    divisor = 2
+    while divisor * divisor <= number:
+        if number % divisor == 0:
+            return divisor
+        divisor += 1
+    return number
 
 
 def _remove_duplicates(input_str: str) -> str:
+    """
+    Collapses a value made of a string of at least 2 characters repeated several times to the shortest such string.
+    :param input_str: The value
+    :return: The repeated string or the value if it is not a repetition
+    """
     if input_str:
         input_length = len(input_str)
         if input_length > 10:
-            for rep in range(input_length // 2, 1, -1):
-                if input_length % rep == 0:
-                    substring = input_str[:input_length // rep]
-                    if substring * rep == input_str:
-                        return substring
+            # The first match of the value in itself doubled is its minimal period, found in linear time
+            period = (input_str + input_str).find(input_str, 1)
+            if period == 1:
+                # Single repeated character: the shortest repeated string is as long as the smallest divisor
+                period = _smallest_divisor(input_length)
+            if period <= input_length // 2:
+                return input_str[:period]
     return input_str
 
 
+def scenario_title(scenario_number: int, name: str) -> str:
+    """
+    Formats the title line of a numbered scenario.
+    :param scenario_number: The scenario number in the feature
+    :param name: The scenario name
+    :return: The scenario title line
+    """
+    return f'Scenario: {scenario_number:0>4}_{name}'
+
+
 class ScenarioSource(abc.ABC):
+    __slots__ = ()
+
     @abc.abstractmethod
-    def api_scenarios(self, big_request: bool) -> tuple[str]:
+    def api_scenarios(self, offload_threshold: int, scenario_number: int) -> tuple[str]:
         """
         Generate scenarios from this source.
-        :param big_request: true if requests must be generated in a separate request file.
+        :param offload_threshold: the size over which a request body, a variable set or a validation set is generated
+        in the separate request file, OFFLOAD_ALL or OFFLOAD_NONE to generate all or none of them there.
+        :param scenario_number: the number of the first scenario, the following ones are numbered in sequence.
         :return: A tuple of scenarios.
         """
         pass
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class APIScenario:
     name: str  # The scenario name
     outputs: tuple[tuple[str, str]] | None  # pairs (expression, value)
@@ -73,6 +86,30 @@ class APIScenario:
     response_code: str | None  # The response code
     url: str  # The scenario url
     variables: tuple[tuple[str, str]] | None  # pairs (expression, variable name)
+    # The values of the outputs classified at construction: None for a response body or else the path validation
+    # value collapsed by _remove_duplicates
+    validation_values: tuple[str | None] = field(init=False, repr=False, compare=False)
+    data_size: int = field(init=False, repr=False, compare=False)  # The estimated size of the request data
+    # The sizes of the variable set and of the validation set, compared with the offload threshold
+    variable_length: int = field(init=False, repr=False, compare=False)
+    validation_length: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        validation_values = []
+        validation_length = 0
+        for expression, value in self.outputs or ():
+            if RESPONSE_BODY_REGEXP.search(expression.lower()):
+                validation_values.append(None)
+            else:
+                validation_values.append(_remove_duplicates(value))
+                validation_length += len(expression) + len(value)
+        request_length = len(self.request) if self.request_type != 'get' else 0
+        variable_length = sum(len(expression) + len(variable)
+                              for expression, variable in self.variables) if self.variables else 0
+        object.__setattr__(self, 'validation_values', tuple(validation_values))
+        object.__setattr__(self, 'variable_length', variable_length)
+        object.__setattr__(self, 'validation_length', validation_length)
+        object.__setattr__(self, 'data_size', 2 * (request_length + variable_length + validation_length))
 
     def _scenario_annotation(self) -> str:
         if self.name.startswith('S_'):
@@ -81,15 +118,28 @@ class APIScenario:
             return '@RegressionTest\n'
         return ''
 
-    def scenario(self, big_request: bool) -> str:
-
+    def _offloaded(self, offload_threshold: int) -> tuple[bool, bool, bool]:
+        """
+        Decides which request data of the scenario is generated in the request file.
+        :param offload_threshold: The size over which a request body, a variable set or a validation set is offloaded
+        :return: A tuple (request, variables, validations) of True for the offloaded ones
+        """
+        if offload_threshold == OFFLOAD_ALL or offload_threshold == OFFLOAD_NONE:
+            offloaded = offload_threshold == OFFLOAD_ALL
+            return offloaded, offloaded, offloaded
+        return (len(self.request) > offload_threshold,
+                self.variable_length > offload_threshold,
+                self.validation_length > offload_threshold)
+
+    def scenario(self, offload_threshold: int, scenario_number: int) -> str:
+        offload_request, offload_variables, offload_validations = self._offloaded(offload_threshold)
         if self.request_type == 'get':
             request_line = f'When I send a GET request to URL "{self.url}" with request header "{self.request_header}"'
         else:
             request_line = f'When I send a request to URL "{self.url}" with request header "{self.request_header}' \
                            + f'" and the following {self.request_type} ' \
-                           + (f'request "{self.name}"' if big_request else f'body\n"""\n{self.request}\n"""')
-        lines = [f'{self._scenario_annotation()}Scenario: {self.name}',
+                           + (f'request "{self.name}"' if offload_request else f'body\n"""\n{self.request}\n"""')
+        lines = [f'{self._scenario_annotation()}{scenario_title(scenario_number, self.name)}',
                  '',
                  request_line]
         # Append validation of response status code
@@ -100,7 +150,7 @@ class APIScenario:
             lines.append(f'Then I validate that the Response Code should be {self.response_code}')
         # Append variable storage from get sheet
         if self.variables:
-            if big_request:
+            if offload_variables:
                 lines.append(f'{prefix} I store the {self.request_type} expressions in {self.name}')
                 prefix = 'And'
             else:
@@ -110,84 +160,95 @@ class APIScenario:
                     prefix = 'And'
         # Append validations from validation sheet
         if self.outputs:
-            if big_request:
+            if offload_validations:
                 validations = False
-                for expression, value in self.outputs:
-                    if RESPONSE_BODY_REGEXP.search(expression.lower()):
+                for (_, value), validation_value in zip(self.outputs, self.validation_values):
+                    if validation_value is None:
                         lines.append(f'{prefix} I validate that the Response Body should be\n"""\n{value}\n"""')
                     else:
                         validations = True
                 if validations:
                     lines.append(f'{prefix} I validate the {self.request_type} expressions in {self.name}')
             else:
-                for expression, value in self.outputs:
-                    if RESPONSE_BODY_REGEXP.search(expression.lower()):
+                for (expression, value), validation_value in zip(self.outputs, self.validation_values):
+                    if validation_value is None:
                         line = f'{prefix} I validate that the Response Body should be\n"""\n{value}\n"""'
                     else:
-                        clean_value = _remove_duplicates(value)
                         line = f'{prefix} I validate that the {self.request_type} path expression "{expression}" should be'
-                        line = line + (
-                            f' "{clean_value}"' if 'json' == self.request_type else f'\n"""\n{clean_value}\n"""')
+                        line = line + (f' "{validation_value}"' if 'json' == self.request_type
+                                       else f'\n"""\n{validation_value}\n"""')
                     lines.append(line)
                     prefix = 'And'
         return '\n'.join(lines)
 
-    def request_data(self) -> list[str]:
-        data = []
-        if self.request_type != 'get':
-            data.append(f'##KEY:##REQUEST:{self.name}')
-            data.append(self.request)
-        if self.variables:
-            data.append(f'##KEY:##STORE:{self.name}')
+    def request_entries(self, offload_threshold: int) -> list[tuple[str, tuple[str, ...]]]:
+        """
+        Gets the request data of the scenario generated in the request file.
+        :param offload_threshold: The size over which a request body, a variable set or a validation set is offloaded
+        :return: A list of pairs (key, payload lines)
+        """
+        offload_request, offload_variables, offload_validations = self._offloaded(offload_threshold)
+        entries = []
+        if self.request_type != 'get' and offload_request:
+            entries.append((f'##REQUEST:{self.name}', (self.request,)))
+        if self.variables and offload_variables:
+            variables = []
             for expression, variable in self.variables:
-                data.append(f'Path:{expression}')
-                data.append(variable)
-        if self.outputs:
+                variables.append(f'Path:{expression}')
+                variables.append(variable)
+            entries.append((f'##STORE:{self.name}', tuple(variables)))
+        if self.outputs and offload_validations:
             validations = []
-            for expression, value in self.outputs:
-                if not RESPONSE_BODY_REGEXP.search(expression.lower()):
+            for (expression, _), validation_value in zip(self.outputs, self.validation_values):
+                if validation_value is not None:
                     validations.append(f'Path:{expression}')
-                    validations.append(_remove_duplicates(value))
+                    validations.append(validation_value)
             if validations:
-                data.append(f'##KEY:##VALIDATE:{self.name}')
-                data.extend(validations)
+                entries.append((f'##VALIDATE:{self.name}', tuple(validations)))
+        return entries
+
+    def request_data(self, offload_threshold: int) -> list[str]:
+        data = []
+        for key, payload in self.request_entries(offload_threshold):
+            data.append(f'##KEY:{key}')
+            data.extend(payload)
         return data
 
     def size(self) -> int:
-        request_length = len(self.request) if self.request_type != 'get' else 0
-        variable_length = sum(len(expression) + len(variable)
-                              for expression, variable in self.variables) if self.variables else 0
-        validation_length = sum(len(expression) + len(value)
-                                for expression, value in self.outputs
-                                if not RESPONSE_BODY_REGEXP.search(expression.lower())) if self.outputs else 0
-        return 2 * (request_length + variable_length + validation_length)
+        return self.data_size
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class APITest(ScenarioSource):
     scenarios: tuple[APIScenario]
 
-    def api_scenarios(self, big_request: bool) -> tuple[str]:
-        return tuple(scenario.scenario(big_request)
-                     for scenario in self.scenarios)
+    def api_scenarios(self, offload_threshold: int, scenario_number: int) -> tuple[str]:
+        return tuple(scenario.scenario(offload_threshold, number)
+                     for number, scenario in enumerate(self.scenarios, scenario_number))
 
-    def request_data(self) -> list[str]:
+    def request_data(self, offload_threshold: int) -> list[str]:
         requests = []
         for scenario in self.scenarios:
-            requests.extend(scenario.request_data())
+            requests.extend(scenario.request_data(offload_threshold))
         return requests
 
+    def request_entries(self, offload_threshold: int) -> list[tuple[str, tuple[str, ...]]]:
+        entries = []
+        for scenario in self.scenarios:
+            entries.extend(scenario.request_entries(offload_threshold))
+        return entries
+
     def size(self) -> int:
         return sum(scenario.size()
                    for scenario in self.scenarios)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class CompareIntScenario(ScenarioSource):
     comparisons: tuple[tuple[str, str, str]]
 
-    def api_scenarios(self, big_request: bool) -> tuple[str]:
-        lines = ['Scenario: CompareIntScenario', '']
+    def api_scenarios(self, offload_threshold: int, scenario_number: int) -> tuple[str]:
+        lines = [scenario_title(scenario_number, 'CompareIntScenario'), '']
         prefix = 'When'
         for exp1, exp2, value in self.comparisons:
             lines.append(f'{prefix} I compare {exp1} with {exp2} and expect result to be {value}')
@@ -195,12 +256,12 @@ class CompareIntScenario(ScenarioSource):
         return ('\n'.join(lines),)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class CreateKeywordScenario(ScenarioSource):
     keywords: tuple[tuple[str, str]]
 
-    def api_scenarios(self, big_request: bool) -> tuple[str]:
-        lines = ['Scenario: CreateKeywordScenario', '']
+    def api_scenarios(self, offload_threshold: int, scenario_number: int) -> tuple[str]:
+        lines = [scenario_title(scenario_number, 'CreateKeywordScenario'), '']
         prefix = 'When'
         for name, value in self.keywords:
             variable_name = '{' + name.replace('{', '').replace('}', '') + '}'
@@ -209,14 +270,14 @@ class CreateKeywordScenario(ScenarioSource):
         return ('\n'.join(lines),)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DatabaseTest(ScenarioSource):
     connection: str
     query: str
     validation: Any
 
-    def api_scenarios(self, big_request: bool) -> tuple[str]:
-        lines = ['Scenario: Database Test',
+    def api_scenarios(self, offload_threshold: int, scenario_number: int) -> tuple[str]:
+        lines = [scenario_title(scenario_number, 'Database Test'),
                  '',
                  f'When I connect to database {self.connection} and run the query {self.query}',
                  'Then I get the following result']
@@ -240,24 +301,24 @@ class DatabaseTest(ScenarioSource):
         return ('\n'.join(lines),)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class SharedStepTest(ScenarioSource):
     project_name: str
     test_case_name: str
     row_index: int
 
-    def api_scenarios(self, big_request: bool) -> tuple[str]:
-        lines = ['Scenario: SharedStep', '',
+    def api_scenarios(self, offload_threshold: int, scenario_number: int) -> tuple[str]:
+        lines = [scenario_title(scenario_number, 'SharedStep'), '',
                  f'When I execute the {self.project_name}/{self.test_case_name} shared step']
         return ('\n'.join(lines),)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class WaitScenario(ScenarioSource):
     time_in_seconds: int
 
-    def api_scenarios(self, big_request: bool) -> tuple[str]:
-        lines = ['Scenario: Wait', '', f'When I wait for {self.time_in_seconds} seconds']
+    def api_scenarios(self, offload_threshold: int, scenario_number: int) -> tuple[str]:
+        lines = [scenario_title(scenario_number, 'Wait'), '', f'When I wait for {self.time_in_seconds} seconds']
         return ('\n'.join(lines),)
 
 
@@ -275,12 +336,14 @@ def xpath_substitution(ui_object: UIObject, value: str) -> tuple[UIObject, str]:
 
 
 class Action(abc.ABC):
+    __slots__ = ()
+
     @abc.abstractmethod
     def generate(self, ui_objects_map):
         pass
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ActionAction(Action):
     action: str
     object_name: str
@@ -293,13 +356,13 @@ class ActionAction(Action):
         return f'{debug_info}I execute the action "{action}" on object {object_ref}'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class CloseAllBrowsersAction(Action):
     def generate(self, _):
         return 'I close all browsers'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class CreateKeywordAction(Action):
     name: str
     value: str
@@ -310,7 +373,7 @@ class CreateKeywordAction(Action):
         return f'{debug_info}I create a keyword with value "{self.value}" in variable "{self.name}"'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DataEntryAction(Action):
     object_name: str
     value: str
@@ -323,7 +386,7 @@ class DataEntryAction(Action):
         return f'{debug_info}I enter "{value}" in object {object_ref}'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class GetObjectDataAction(Action):
     object_name: str
     value: str
@@ -335,7 +398,7 @@ class GetObjectDataAction(Action):
         return f'{debug_info}I get data from object {object_ref} in "{self.value}"'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class LaunchAUTAction(Action):
     url: str
 
@@ -343,7 +406,7 @@ class LaunchAUTAction(Action):
         return f'I launch the application at url "{self.url}"'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ObjectTestAction(Action):
     object_name: str
     state: str
@@ -356,13 +419,13 @@ class ObjectTestAction(Action):
         return f'{debug_info}I test that object {object_ref} {self.state} is "{self.value}"'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TakeScreenShotAction(Action):
     def generate(self, _):
         return 'I take a screenshot'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ValidationAction(Action):
     object_name: str
     value: str
@@ -376,7 +439,7 @@ class ValidationAction(Action):
         return f'{debug_info}I validate that object {object_ref} has value "{value}"'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class WaitAction(Action):
     time_in_seconds: int
     object_name: str = None
@@ -390,12 +453,12 @@ class WaitAction(Action):
         return f'I wait for {self.time_in_seconds} seconds'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class UITest(ScenarioSource):
     actions: tuple[Action]
     ui_objects_map: dict[str, UIObject]
 
-    def api_scenarios(self, big_request: bool) -> tuple[str]:
+    def api_scenarios(self, offload_threshold: int, scenario_number: int) -> tuple[str]:
         def assertion_func(action: Action) -> bool:
             return isinstance(action, ObjectTestAction) \
                 or isinstance(action, ValidationAction)
@@ -416,7 +479,7 @@ class UITest(ScenarioSource):
                 return current_state
             return 'V' if is_assertion_action else 'A'
 
-        lines = ['Scenario: UI Test', '']
+        lines = [scenario_title(scenario_number, 'UI Test'), '']
         state = 'S'
         for action in self.actions:
             action_line = action.generate(self.ui_objects_map)
@@ -0,0 +1,71 @@
+import hashlib
+import mmap
+import struct
+
+# Layout of an indexed request file:
+# - the header: magic, number of slots, number of keys, offset of the data
+# - the open addressing hash table of the keys, linear probing, one slot per power of two
+#   slot: key hash, key offset, payload offset, key length (0 for an empty slot), payload length
+# - the data: the UTF-8 keys and payloads, the offsets of the slots are from the start of the file
+INDEXED_REQUEST_FILE_MAGIC = b'ETMREQX1'
+INDEXED_REQUEST_FILE_SUFFIX = '.reqx'
+HEADER = struct.Struct('<8sIIQ')
+SLOT = struct.Struct('<QQQII')
+
+
+def key_hash(key: bytes) -> int:
+    """
+    Hashes a key of an indexed request file, independently of the Python process.
+    :param key: The UTF-8 key
+    :return: The 64 bits hash of the key
+    """
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+class RequestReader:
+    """
+    Reads the payloads of an indexed request file by key, without loading the file.
+    The file is memory-mapped and a key is found in O(1) with the hash table at the start of the file.
+    """
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slot_count, self.key_count, _ = HEADER.unpack_from(self.map, 0)
+        if magic != INDEXED_REQUEST_FILE_MAGIC:
+            self.map.close()
+            raise ValueError(f'{filename} is not an indexed request file')
+
+    def __enter__(self) -> 'RequestReader':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.key_count
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def close(self) -> None:
+        self.map.close()
+
+    def get(self, key: str) -> str | None:
+        """
+        Gets the payload of a key.
+        :param key: The key, like ##REQUEST:<scenario name>, ##STORE:<scenario name> or ##VALIDATE:<scenario name>
+        :return: The payload lines joined by new lines, None if the key is not in the file
+        """
+        encoded_key = key.encode('UTF-8')
+        hash_value = key_hash(encoded_key)
+        mask = self.slot_count - 1
+        slot_index = hash_value & mask
+        while True:
+            slot_hash, key_offset, payload_offset, key_length, payload_length = \
+                SLOT.unpack_from(self.map, HEADER.size + slot_index * SLOT.size)
+            if key_length == 0:
+                return None
+            if slot_hash == hash_value and self.map[key_offset:key_offset + key_length] == encoded_key:
+                return self.map[payload_offset:payload_offset + payload_length].decode('UTF-8')
+            slot_index = (slot_index + 1) & mask
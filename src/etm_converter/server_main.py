@@ -0,0 +1,256 @@
+import argparse
+import json
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from etm_converter import ui_converter
+from etm_converter.converter import convert_api_workbook, convert_ui_workbook, create_worker_pool, run_in_worker
+from etm_converter.converter_common import UIObject
+from etm_converter.excel_utils import LOADER_VERSION
+from etm_converter.generator import DefaultFeatureGenerator, FeatureGenerator, SAPIFeatureGenerator
+from etm_converter.substitution import load_substitution_rules, set_substitution_rules, BUILTIN_RULES, \
+    DEFAULT_SUBSTITUTION_CACHE_ENTRIES, SubstitutionRule
+from etm_converter.workbook_cache import default_cache_dir, WorkbookCache
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_THREADS = 8
+# Maximum size in bytes of an uploaded workbook
+MAX_UPLOAD_SIZE = 64 * 1024 * 1024
+# Seconds after which an idle keep-alive connection, or a stalled upload, is closed and its thread released
+REQUEST_TIMEOUT = 30
+
+
+@dataclass(frozen=True)
+class _Converter:
+    """
+    The conversion parameters of the server, shared by its worker processes.
+    """
+    ui_objects_map: dict[str, UIObject] | None
+    feature_generator: FeatureGenerator
+    sapi_feature_generator: FeatureGenerator | None
+    cache: WorkbookCache | None
+    check_xml: bool
+    offload_threshold: int | None
+    dedup_requests: bool
+
+    def __call__(self, kind: str, name: str, selector: str | None, content: bytes) -> tuple[str, str | None] | None:
+        """
+        Converts an uploaded workbook into the content of its feature file and optional request file.
+        :param kind: api or ui
+        :param name: The workbook file name without extension, the feature name
+        :param selector: The optional selector
+        :param content: The workbook content
+        :return: The feature file content and the request file content or None, None if the workbook can not be
+        converted
+        """
+        feature_generator = self.sapi_feature_generator if selector and 'sapi' in selector.lower() \
+            else self.feature_generator
+        options = dict(selector=selector, feature_generator=feature_generator, cache=self.cache,
+                       check_xml=self.check_xml, offload_threshold=self.offload_threshold,
+                       dedup_requests=self.dedup_requests)
+        if kind == 'ui':
+            conversion = convert_ui_workbook(name, content, self.ui_objects_map, **options)
+        else:
+            conversion = convert_api_workbook(name, content, **options)
+        return None if conversion is None else (conversion.feature, conversion.requests)
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """
+    HTTP server handling the requests with a bounded pool of threads.
+    The conversions run in the handling threads, or in the worker processes when there is a process pool.
+    """
+
+    def __init__(self,
+                 address: tuple[str, int],
+                 threads: int,
+                 converter: _Converter,
+                 workers: ProcessPoolExecutor | None):
+        super().__init__(address, ConversionRequestHandler)
+        self.threads = ThreadPoolExecutor(threads)
+        self.converter = converter
+        self.workers = workers
+
+    def process_request(self, request, client_address) -> None:
+        self.threads.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.threads.shutdown()
+        if self.workers is not None:
+            self.workers.shutdown()
+
+    def convert(self, kind: str, name: str, selector: str | None, content: bytes) -> tuple[str, str | None] | None:
+        if self.workers is None:
+            return self.converter(kind, name, selector, content)
+        result, _ = self.workers.submit(run_in_worker, kind, name, selector, content).result()
+        return result
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health: 200 when the server is up.
+    POST /api?name=<name>&selector=<selector> or /ui?name=<name>&selector=<selector>, with the xlsx file as body:
+    200 with the json {"feature": <feature file>, "requests": <request file or null>}, 422 if the workbook can not be
+    converted. The body length must be given by Content-Length, 411 otherwise.
+    """
+    server: ConversionServer
+    protocol_version = 'HTTP/1.1'
+    timeout = REQUEST_TIMEOUT
+
+    def _reply(self, status: HTTPStatus, body: dict) -> None:
+        content = json.dumps(body).encode('UTF-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _error(self, status: HTTPStatus, message: str) -> None:
+        self._reply(status, {'error': message})
+
+    def do_GET(self) -> None:
+        if urlsplit(self.path).path == '/health':
+            self._reply(HTTPStatus.OK, {'status': 'ok'})
+        else:
+            self._error(HTTPStatus.NOT_FOUND, f'Unknown path {self.path}')
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        if self.headers.get('Content-Length') is None:
+            # The body can not be skipped to read the next request of the connection
+            self.close_connection = True
+            self._error(HTTPStatus.LENGTH_REQUIRED, 'The Content-Length header is required')
+            return
+        try:
+            length = int(self.headers['Content-Length'])
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._error(HTTPStatus.BAD_REQUEST, f'Invalid Content-Length {self.headers["Content-Length"]}')
+            return
+        if length > MAX_UPLOAD_SIZE:
+            self.close_connection = True
+            self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f'The workbook exceeds {MAX_UPLOAD_SIZE} bytes')
+            return
+        content = self.rfile.read(length)
+        kind = url.path.strip('/')
+        if kind not in ('api', 'ui'):
+            self._error(HTTPStatus.NOT_FOUND, f'Unknown path {url.path}')
+            return
+        if kind == 'ui' and self.server.converter.ui_objects_map is None:
+            self._error(HTTPStatus.NOT_FOUND, 'The server was started without UI objects')
+            return
+        query = parse_qs(url.query)
+        name = query.get('name', [None])[0]
+        selector = query.get('selector', [None])[0]
+        if not name or not content:
+            self._error(HTTPStatus.BAD_REQUEST, 'The name parameter and the workbook are required')
+            return
+        if selector and 'sapi' in selector.lower() and self.server.converter.sapi_feature_generator is None:
+            self._error(HTTPStatus.BAD_REQUEST, 'The server was started without Suite.json')
+            return
+        try:
+            result = self.server.convert(kind, name, selector, content)
+        except Exception as e:
+            print(f'ERROR: Unable to convert {name}.xlsx: {e}', file=sys.stderr)
+            self._error(HTTPStatus.INTERNAL_SERVER_ERROR, f'Unable to convert {name}.xlsx: {e}')
+            return
+        if result is None:
+            self._error(HTTPStatus.UNPROCESSABLE_ENTITY, f'An error happened while parsing {name}.xlsx')
+            return
+        feature, requests = result
+        self._reply(HTTPStatus.OK, {'feature': feature, 'requests': requests})
+
+
+def _create_workers(jobs: int,
+                    converter: _Converter,
+                    substitution_rules: tuple[SubstitutionRule, ...],
+                    substitution_cache_size: int) -> ProcessPoolExecutor | None:
+    """
+    Creates the process pool of the conversions, see create_worker_pool.
+    :param jobs: The number of worker processes, 1 to convert in the server process
+    :param converter: The conversion parameters
+    :param substitution_rules: The substitution rules
+    :param substitution_cache_size: The substitution cache size
+    :return: The process pool, None to convert in the server process
+    """
+    set_substitution_rules(substitution_rules, substitution_cache_size)
+    if jobs <= 1:
+        return None
+    workers = create_worker_pool(jobs, converter, substitution_rules, substitution_cache_size)
+    # Starts the workers now, before the threads handling the requests exist
+    for future in [workers.submit(int) for _ in range(jobs)]:
+        future.result()
+    return workers
+
+
+def server_main():
+    parser = argparse.ArgumentParser(prog='etcserver',
+                                     description='Serve the conversion of excel files to Gherkin test scenarios '
+                                                 'over HTTP',
+                                     usage='etcserver [--jobs JOBS] [--no-cache] [--cache-dir CACHE_DIR] '
+                                           '[--check-xml] [--dedup-requests] [--host HOST] '
+                                           '[--offload-threshold OFFLOAD_THRESHOLD] [--port PORT] '
+                                           '[--substitution-rules SUBSTITUTION_RULES] '
+                                           '[--substitution-cache-size SUBSTITUTION_CACHE_SIZE] '
+                                           '[--suite-dir SUITE_DIR] [--threads THREADS] '
+                                           '[--ui-objects UI_OBJECTS_FILENAME]')
+    parser.add_argument('--cache-dir', default=default_cache_dir(), help='directory of the parsed workbook cache')
+    parser.add_argument('--check-xml', action='store_true', help='check that the xml request bodies are well-formed')
+    parser.add_argument('--dedup-requests', action='store_true',
+                        help='write each distinct request body, variable set or validation set of the request file '
+                             'once')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='address the server listens on')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of worker processes converting the workbooks, 1 converts in the server process')
+    parser.add_argument('--no-cache', action='store_true', help='parse every workbook with openpyxl')
+    parser.add_argument('--offload-threshold', type=int,
+                        help='size over which a request body, variable set or validation set of a scenario is '
+                             'written to the request file, instead of all or none of them depending on the feature '
+                             'size')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port the server listens on')
+    parser.add_argument('--substitution-cache-size', type=int, default=DEFAULT_SUBSTITUTION_CACHE_ENTRIES,
+                        help='maximum number of memoised substituted values, 0 disables the memo')
+    parser.add_argument('--substitution-rules', help='json file of site specific value substitution rules')
+    parser.add_argument('--suite-dir', help='folder of the Suite.json used with the sapi selectors')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help='number of requests handled concurrently')
+    parser.add_argument('--ui-objects', help='UI objects workbook, required by the /ui conversions')
+    args = parser.parse_args()
+    substitution_rules = BUILTIN_RULES
+    if args.substitution_rules:
+        substitution_rules = load_substitution_rules(args.substitution_rules)
+        if substitution_rules is None:
+            return
+    cache = None if args.no_cache else WorkbookCache(args.cache_dir, LOADER_VERSION)
+    ui_objects_map = None
+    if args.ui_objects:
+        ui_objects_map = ui_converter.parse_ui_objects(args.ui_objects, cache)
+        if ui_objects_map is None:
+            return
+    sapi_feature_generator = SAPIFeatureGenerator(args.suite_dir) if args.suite_dir else None
+    converter = _Converter(ui_objects_map, DefaultFeatureGenerator(), sapi_feature_generator, cache, args.check_xml,
+                           args.offload_threshold, args.dedup_requests)
+    workers = _create_workers(args.jobs, converter, substitution_rules, args.substitution_cache_size)
+    server = ConversionServer((args.host, args.port), args.threads, converter, workers)
+    # Stops on SIGTERM as on Ctrl+C, so that the worker processes are shut down too
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f'Serving on http://{args.host}:{server.server_port}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    server_main()
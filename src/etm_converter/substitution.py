@@ -0,0 +1,335 @@
+import contextvars
+import json
+import re
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+# regexp for substitution of values in api tests and create keyword actions
+GUID_REGEXP = re.compile(r'~csharp\(\s*"?\s*Guid.NewGuid\(\).ToString\(\)\s*"?\s*\)', re.IGNORECASE)
+NOW_REGEXP = re.compile(r'~csharp\(\s*DateTime.(Now|Today)(.*)ToString\("(.*)"\)\)', re.IGNORECASE)
+NOW_ADD_DAYS_REGEXP = re.compile(r'AddDays\(\s*([^)]*)\s*\)')
+NOW_ADD_MONTHS_REGEXP = re.compile(r'AddMonths\(\s*([^)]*)\s*\)')
+NOW_ADD_YEARS_REGEXP = re.compile(r'AddYears\(\s*([^)]*)\s*\)')
+PHONE_REGEXP = re.compile(r'~csharp\(return string.Format\(.*201275.*new Random\(\).Next\(1000\s*,\s*9999\)\);\)',
+                          re.IGNORECASE)
+STRING_REGEXP = re.compile(r'^~string\("(.*)"\)$', re.IGNORECASE)
+SUBSTRING1_REGEXP = re.compile(r'~csharp\(\s*"({[^{}]*})".substring\(\s*(\d+)\s*\)\)', re.IGNORECASE)
+SUBSTRING2_REGEXP = re.compile(r'~csharp\(\s*"({[^{}]*})".substring\(\s*(\d+)\s*,\s*(\d+)\s*\)\)', re.IGNORECASE)
+TO_TITLE_CASE_REGEXP = re.compile(
+    r'~csharp\(\s*CultureInfo\.CurrentCulture\.TextInfo\.ToTitleCase\(\s*"({[^{}]*})"\s*\)\s*\)\s*$',
+    re.IGNORECASE)
+
+CSHARP_TRIGGER = '~csharp('
+DEFAULT_SUBSTITUTION_CACHE_ENTRIES = 65536
+# Longer values, like whole request or validation bodies, are substituted without being memoised
+MAX_MEMOISED_VALUE_LENGTH = 256
+
+RULE_NAME = 'name'
+RULE_PATTERN = 'pattern'
+RULE_REPLACEMENT = 'replacement'
+RULE_TRIGGER = 'trigger'
+
+
+@dataclass(frozen=True)
+class RegexpSubstitution:
+    """
+    Substitution of the matches of a regular expression, used by the rules read from a configuration file.
+    """
+    regexp: re.Pattern
+    replacement: str
+
+    def __call__(self, value: str, lower: str) -> str | None:
+        if self.regexp.search(value):
+            return self.regexp.sub(self.replacement, value)
+        return None
+
+
+@dataclass(frozen=True)
+class SubstitutionRule:
+    """
+    A substitution rule.
+    The trigger is a lower case literal contained in every value the rule applies to, the rule is only run on the
+    values containing it. The substitute function gets the value and its lower case version, it returns the
+    substituted value or None when the rule does not apply.
+    """
+    name: str
+    trigger: str
+    substitute: Callable[[str, str], str | None]
+
+
+@dataclass(frozen=True)
+class SubstitutionEngine:
+    """
+    Applies the first matching rule of a table of substitution rules.
+    Values containing none of the anchor characters of the triggers, almost all of them, are returned right away.
+    The other values are searched for all the triggers at once with a single compiled regexp and only the rules
+    whose trigger is found are run.
+    """
+    rules: tuple[SubstitutionRule, ...]
+    anchors: tuple[str, ...]
+    trigger_regexp: re.Pattern
+
+    def has_anchor(self, value: str) -> bool:
+        """
+        Cheap pre-check of the values that may contain a trigger.
+        :param value: The value
+        :return: False if no rule applies to the value
+        """
+        for anchor in self.anchors:
+            if anchor in value:
+                return True
+        return False
+
+    def substitute(self, value: str | None) -> str | None:
+        if value is None or not self.has_anchor(value):
+            return value
+        if not self.trigger_regexp.search(value):
+            return value
+        lower = value.lower()
+        for rule in self.rules:
+            if rule.trigger in lower:
+                substituted = rule.substitute(value, lower)
+                if substituted is not None:
+                    return substituted
+        return value
+
+
+def _parse_now(regexp: re.Pattern, suffix: str, value: str) -> str:
+    match = regexp.search(value)
+    if match:
+        try:
+            count = int(match.group(1))
+            if count == 0:
+                return ''
+            return ('+' if count > 0 else '') + str(count) + suffix
+        except ValueError:
+            return ''
+    return ''
+
+
+def _substitute_concat(value: str, lower: str) -> str | None:
+    return f'~concat[[{value}]]'
+
+
+def _substitute_email(value: str, lower: str) -> str | None:
+    return 'bitbucket@geico.com' if '~email' == lower else None
+
+
+def _substitute_guid(value: str, lower: str) -> str | None:
+    return '~guid' if GUID_REGEXP.search(value) else None
+
+
+def _substitute_now(value: str, lower: str) -> str | None:
+    match = NOW_REGEXP.search(value)
+    if match:
+        adders = match.group(2)
+        now_expr = '~now' \
+                   + _parse_now(NOW_ADD_YEARS_REGEXP, 'y', adders) \
+                   + _parse_now(NOW_ADD_MONTHS_REGEXP, 'm', adders) \
+                   + _parse_now(NOW_ADD_DAYS_REGEXP, 'd', adders) \
+                   + '{' + match.group(3) + '}'
+        return NOW_REGEXP.sub(now_expr, value)
+    return None
+
+
+def _substitute_phone(value: str, lower: str) -> str | None:
+    if PHONE_REGEXP.search(value):
+        return PHONE_REGEXP.sub('201275~random{1000}', value)
+    return None
+
+
+def _substitute_string(value: str, lower: str) -> str | None:
+    match = STRING_REGEXP.search(value)
+    return match.group(1) if match else None
+
+
+def _substitute_substring1(value: str, lower: str) -> str | None:
+    match = SUBSTRING1_REGEXP.search(value)
+    if match:
+        return SUBSTRING1_REGEXP.sub(f'~substring({match.group(1)},{match.group(2)})', value)
+    return None
+
+
+def _substitute_substring2(value: str, lower: str) -> str | None:
+    match = SUBSTRING2_REGEXP.search(value)
+    if match:
+        return SUBSTRING2_REGEXP.sub(f'~substring({match.group(1)},{match.group(2)},{match.group(3)})', value)
+    return None
+
+
+def _substitute_title_case(value: str, lower: str) -> str | None:
+    match = TO_TITLE_CASE_REGEXP.search(value)
+    return f'~toTitleCase({match.group(1)})' if match else None
+
+
+# The built-in rules in order of precedence
+BUILTIN_RULES = (
+    # Add the ~concat[[....]] around values containing potential concatenation
+    SubstitutionRule('concat', 'text(now()', _substitute_concat),
+    SubstitutionRule('now', CSHARP_TRIGGER, _substitute_now),
+    SubstitutionRule('phone', CSHARP_TRIGGER, _substitute_phone),
+    # Generate ~guid for csharp guid function
+    SubstitutionRule('guid', CSHARP_TRIGGER, _substitute_guid),
+    # Check for substring functions given in csharp
+    SubstitutionRule('substring1', CSHARP_TRIGGER, _substitute_substring1),
+    SubstitutionRule('substring2', CSHARP_TRIGGER, _substitute_substring2),
+    # Substitute the ~string("...") expressions
+    SubstitutionRule('string', '~string("', _substitute_string),
+    SubstitutionRule('title case', CSHARP_TRIGGER, _substitute_title_case),
+    # Substitute the value of ~email
+    SubstitutionRule('email', '~email', _substitute_email))
+
+
+def _anchors(trigger: str) -> tuple[str, ...]:
+    """
+    Gets the anchor characters of a trigger, one of them is in every value containing the trigger.
+    :param trigger: The lower case trigger
+    :return: The first punctuation character of the trigger or both cases of its first character
+    """
+    for char in trigger:
+        if not char.isalnum() and not char.isspace():
+            return (char,)
+    return tuple({trigger[0], trigger[0].upper()})
+
+
+def create_substitution_engine(rules: tuple[SubstitutionRule, ...]) -> SubstitutionEngine:
+    triggers = sorted({rule.trigger for rule in rules}, key=len, reverse=True)
+    anchors = tuple(dict.fromkeys(anchor for trigger in triggers for anchor in _anchors(trigger)))
+    trigger_regexp = re.compile('|'.join(re.escape(trigger) for trigger in triggers), re.IGNORECASE)
+    return SubstitutionEngine(rules, anchors, trigger_regexp)
+
+
+def load_substitution_rules(filename: str) -> tuple[SubstitutionRule, ...] | None:
+    """
+    Loads site specific substitution rules from a json file.
+    The file contains a list of objects with a name, a trigger, a pattern and a replacement. The pattern is a case
+    insensitive regexp, its matches are replaced by the replacement. The trigger is a literal contained in all the
+    values matched by the pattern.
+    :param filename: The name of the json file
+    :return: The built-in rules followed by the rules of the file or None if the file is not valid
+    """
+    try:
+        with open(filename, encoding='utf-8') as file:
+            entries = json.load(file)
+        rules = []
+        for entry in entries:
+            trigger = entry[RULE_TRIGGER].lower()
+            if not trigger:
+                raise ValueError(f'Empty trigger for rule {entry[RULE_NAME]}')
+            substitute = RegexpSubstitution(re.compile(entry[RULE_PATTERN], re.IGNORECASE), entry[RULE_REPLACEMENT])
+            rules.append(SubstitutionRule(entry[RULE_NAME], trigger, substitute))
+        return BUILTIN_RULES + tuple(rules)
+    except KeyError as e:
+        print(f'ERROR: Invalid substitution rules file {filename}: missing {e}', file=sys.stderr)
+        return None
+    except (OSError, ValueError, TypeError, re.error) as e:
+        print(f'ERROR: Invalid substitution rules file {filename}: {e}', file=sys.stderr)
+        return None
+
+
+@dataclass(frozen=True)
+class CacheStatistics:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def __add__(self, other: 'CacheStatistics') -> 'CacheStatistics':
+        return CacheStatistics(self.hits + other.hits, self.misses + other.misses, self.evictions + other.evictions)
+
+    def __sub__(self, other: 'CacheStatistics') -> 'CacheStatistics':
+        return CacheStatistics(self.hits - other.hits, self.misses - other.misses, self.evictions - other.evictions)
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups else 0
+        return f'Substitution cache: hits {self.hits}, misses {self.misses}, evictions {self.evictions}, ' \
+               f'hit rate {hit_rate:.1f}%'
+
+
+class SubstitutionCache:
+    """
+    Bounded memo of the substituted values, the least recently used entries are evicted first.
+    Entries are keyed by scope and value so that values never leak from one selector to another.
+    Only the values that may contain a trigger and are at most MAX_MEMOISED_VALUE_LENGTH long are memoised: the
+    pre-check of the engine is cheaper than a lookup and the size of the memo stays bounded.
+    """
+
+    def __init__(self, engine: SubstitutionEngine, max_size: int):
+        self.engine = engine
+        self.max_size = max_size
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def statistics(self) -> CacheStatistics:
+        with self._lock:
+            return CacheStatistics(self._hits, self._misses, self._evictions)
+
+    def substitute(self, scope: str | None, value: str | None) -> str | None:
+        if value is None or not self.engine.has_anchor(value):
+            return value
+        if self.max_size <= 0 or len(value) > MAX_MEMOISED_VALUE_LENGTH:
+            return self.engine.substitute(value)
+        key = (scope, value)
+        with self._lock:
+            substituted = self._values.get(key)
+            if substituted is not None:
+                self._values.move_to_end(key)
+                self._hits += 1
+                return substituted
+        substituted = self.engine.substitute(value)
+        with self._lock:
+            self._misses += 1
+            self._values[key] = substituted
+            if len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+                self._evictions += 1
+        return substituted
+
+
+_cache = SubstitutionCache(create_substitution_engine(BUILTIN_RULES), DEFAULT_SUBSTITUTION_CACHE_ENTRIES)
+# The selector of the workbook being converted
+_scope = contextvars.ContextVar('substitution_scope', default=None)
+
+
+def set_substitution_rules(rules: tuple[SubstitutionRule, ...],
+                           cache_max_size: int = DEFAULT_SUBSTITUTION_CACHE_ENTRIES) -> None:
+    """
+    Replaces the rules used by substitute_value and empties the substitution cache.
+    :param rules: The rules in order of precedence
+    :param cache_max_size: The maximum number of cached values, 0 disables the cache
+    """
+    global _cache
+    _cache = SubstitutionCache(create_substitution_engine(rules), cache_max_size)
+
+
+def set_substitution_scope(scope: str | None) -> None:
+    """
+    Sets the scope of the cached values for the current thread, the selector of the workbook being converted.
+    :param scope: The scope
+    """
+    _scope.set(scope)
+
+
+def substitution_statistics() -> CacheStatistics:
+    return _cache.statistics()
+
+
+def substitute_value(value: str | None) -> str | None:
+    """
+    Substitution of values for api tests and create keyword actions
+    1. Add the ~concat[[....]] around values containing potential concatenation.
+    2. Generate ~guid for csharp guid function
+    3. Check for substring functions given in csharp
+    4. Substitute the ~string("...") expressions
+    5. Substitute the value of ~email
+    6. Apply the site specific rules
+    :param value: The value to process
+    :return: The processed value.
+    """
+    return _cache.substitute(_scope.get(), value)
@@ -1,12 +1,17 @@
 import re
 import sys
-from typing import Callable
+from typing import Callable, Iterator
 
 import etm_converter.model as model
 from etm_converter import api_converter
 from etm_converter.converter_common import create_parsing_context, create_repository_sheet, \
-    parse_time, substitute_value, ParsingContext, TestDataSheet, UIObject
+    parse_time, substitute_value, ParsingContext, TestDataSheet, UIObject, TAC_ACTION, TAC_CLOSE_ALL, \
+    TAC_COMPARE_INT, TAC_CREATE_KEYWORD, TAC_DATABASE_TEST, TAC_DATA_ENTRY, TAC_DATA_ENTRY_CUSTOM, \
+    TAC_GET_OBJECT_DATA, TAC_LAUNCH_AUT, TAC_NONE, TAC_OBJECT_ENABLED, TAC_OBJECT_EXIST, TAC_OBJECT_HIDDEN, \
+    TAC_OBJECT_NOT_ENABLED, TAC_OBJECT_NOT_EXIST, TAC_OBJECT_NOT_HIDDEN, TAC_SHARED_STEP, TAC_TAKE_SCREENSHOT, \
+    TAC_VALIDATION, TAC_WAIT, TAC_WAIT_FOR_OBJECT, TAC_WEB_SERVICE
 from etm_converter.excel_utils import load_excel
+from etm_converter.workbook_cache import WorkbookCache
 
 DEFAULT_WAIT_FOR_OBJECT_IN_SECONDS = 60
 COMPARE_INT_REGEXP = re.compile(r'^(.*)=(.*)$')
@@ -17,28 +22,35 @@ STATE_START = 0
 STATE_COMPARE_INT = 1
 STATE_CREATE_KEYWORD = 2
 STATE_UI = 3
-SINGLE_ROW_SCENARIO_ACTIONS = {model.TAF_DATABASE_TEST, model.TAF_SHARED_STEP, model.TAF_WEB_SERVICE}
+SINGLE_ROW_SCENARIO_ACTIONS = {TAC_DATABASE_TEST, TAC_SHARED_STEP, TAC_WEB_SERVICE}
 
-TEST_ASSERTIONS = (model.TAF_OBJECT_NOT_ENABLED, model.TAF_OBJECT_NOT_EXIST, model.TAF_OBJECT_NOT_HIDDEN,
-                   model.TAF_OBJECT_ENABLED, model.TAF_OBJECT_EXIST, model.TAF_OBJECT_HIDDEN, model.TAF_VALIDATION)
+NEGATED_ACTIONS = {TAC_OBJECT_NOT_ENABLED, TAC_OBJECT_NOT_EXIST, TAC_OBJECT_NOT_HIDDEN}
+TEST_ASSERTIONS = (TAC_OBJECT_NOT_ENABLED, TAC_OBJECT_NOT_EXIST, TAC_OBJECT_NOT_HIDDEN,
+                   TAC_OBJECT_ENABLED, TAC_OBJECT_EXIST, TAC_OBJECT_HIDDEN, TAC_VALIDATION)
 
 
-def parse_ui_objects(filename: str) -> dict[str, UIObject] | None:
+def parse_ui_objects(filename: str, cache: WorkbookCache | None = None,
+                     content: bytes | None = None) -> dict[str, UIObject] | None:
     """
     Parses the given Excel file into a map of UIObjects.
 
     :param filename: The name of the file to parse
+    :param cache: The optional workbook cache
+    :param content: The optional content of the workbook, filename is then only used in messages
     :return: A map of Object names to UIObject
     """
     try:
         print(f'Parsing UI Objects file: {filename}', file=sys.stderr)
-        spread_sheet = load_excel(filename)
-        return {ui_object.object_name: ui_object
-                for ui_object in (repository_sheet.ui_object(row_index)
-                                  for repository_sheet in (create_repository_sheet(spread_sheet.sheet(sheet_name))
-                                                           for sheet_name in spread_sheet.sheet_names())
-                                  for row_index in range(1, repository_sheet.rows()))
-                if ui_object is not None}
+        spread_sheet = load_excel(filename, cache, content)
+        try:
+            return {ui_object.object_name: ui_object
+                    for ui_object in (repository_sheet.ui_object(row_index)
+                                      for repository_sheet in (create_repository_sheet(spread_sheet.sheet(sheet_name))
+                                                               for sheet_name in spread_sheet.sheet_names())
+                                      for row_index in range(1, repository_sheet.rows()))
+                    if ui_object is not None}
+        finally:
+            spread_sheet.close()
     except Exception as e:
         print(e, file=sys.stderr)
         return None
@@ -59,16 +71,16 @@ def _locate_scenarios(sheet: TestDataSheet) -> list[tuple[int, int]]:
     start = None
     state = STATE_START
     for row_index in range(1, sheet.rows()):
-        testing_action = sheet.action(row_index).lower()
-        if testing_action and sheet.runnable(row_index):
+        testing_action = sheet.action_code(row_index)
+        if testing_action != TAC_NONE and sheet.runnable(row_index):
             if state == STATE_START:
                 # start state: We check for one line scenarios and for start create keyword and start ui
                 if testing_action in SINGLE_ROW_SCENARIO_ACTIONS:
                     scenarios.append((row_index, row_index + 1))
-                elif testing_action == model.TAF_COMPARE_INT:
+                elif testing_action == TAC_COMPARE_INT:
                     start = row_index
                     state = STATE_COMPARE_INT
-                elif testing_action == model.TAF_CREATE_KEYWORD:
+                elif testing_action == TAC_CREATE_KEYWORD:
                     start = row_index
                     state = STATE_CREATE_KEYWORD
                 else:
@@ -81,10 +93,10 @@ def _locate_scenarios(sheet: TestDataSheet) -> list[tuple[int, int]]:
                     scenarios.append((row_index, row_index + 1))
                     start = None
                     state = STATE_START
-                elif testing_action != model.TAF_COMPARE_INT:
+                elif testing_action != TAC_COMPARE_INT:
                     scenarios.append((start, row_index))
                     start = row_index
-                    state = STATE_CREATE_KEYWORD if testing_action == model.TAF_CREATE_KEYWORD else STATE_UI
+                    state = STATE_CREATE_KEYWORD if testing_action == TAC_CREATE_KEYWORD else STATE_UI
             elif state == STATE_CREATE_KEYWORD:
                 # create keyword state: we check for one line scenarios and start ui
                 if testing_action in SINGLE_ROW_SCENARIO_ACTIONS:
@@ -92,10 +104,10 @@ def _locate_scenarios(sheet: TestDataSheet) -> list[tuple[int, int]]:
                     scenarios.append((row_index, row_index + 1))
                     start = None
                     state = STATE_START
-                elif testing_action != model.TAF_CREATE_KEYWORD:
+                elif testing_action != TAC_CREATE_KEYWORD:
                     scenarios.append((start, row_index))
                     start = row_index
-                    state = STATE_COMPARE_INT if testing_action == model.TAF_CREATE_KEYWORD else STATE_UI
+                    state = STATE_COMPARE_INT if testing_action == TAC_CREATE_KEYWORD else STATE_UI
             else:
                 # ui state: we check for one line scenarios and end ui
                 if testing_action in SINGLE_ROW_SCENARIO_ACTIONS:
@@ -103,11 +115,11 @@ def _locate_scenarios(sheet: TestDataSheet) -> list[tuple[int, int]]:
                     scenarios.append((row_index, row_index + 1))
                     start = None
                     state = STATE_START
-                elif testing_action == model.TAF_COMPARE_INT:
+                elif testing_action == TAC_COMPARE_INT:
                     scenarios.append((start, row_index))
                     start = row_index
                     state = STATE_COMPARE_INT
-                elif testing_action == model.TAF_CLOSE_ALL:
+                elif testing_action == TAC_CLOSE_ALL:
                     scenarios.append((start, row_index + 1))
                     start = None
                     state = STATE_START
@@ -205,8 +217,7 @@ def _parse_object_flags(sheet: TestDataSheet,
                         row_index: int,
                         ui_objects_map: dict[str, UIObject],
                         action_factory: Callable[[str, str, int], model.Action]) -> tuple[model.Action] | None:
-    testing_action = sheet.action(row_index)
-    negated = 'not' in testing_action.lower()
+    negated = sheet.action_code(row_index) in NEGATED_ACTIONS
     actions = []
     error = False
     for object_name, value in _parse_name_value_pairs(sheet, row_index, ui_objects_map):
@@ -284,23 +295,23 @@ def _parse_wait_for_object(parsing_context: ParsingContext,
     return None
 
 
-ACTION_PARSERS = {model.TAF_ACTION: _parse_action,
-                  model.TAF_CLOSE_ALL: _parse_close_all_browser,
-                  model.TAF_CREATE_KEYWORD: _parse_create_keyword,
-                  model.TAF_DATA_ENTRY: _parse_data_entry,
-                  model.TAF_DATA_ENTRY_CUSTOM: _parse_data_entry,
-                  model.TAF_GET_OBJECT_DATA: _parse_get_object_data,
-                  model.TAF_LAUNCH_AUT: _parse_launch_aut,
-                  model.TAF_OBJECT_ENABLED: _parse_object_enabled,
-                  model.TAF_OBJECT_NOT_ENABLED: _parse_object_enabled,
-                  model.TAF_OBJECT_EXIST: _parse_object_exists,
-                  model.TAF_OBJECT_NOT_EXIST: _parse_object_exists,
-                  model.TAF_OBJECT_HIDDEN: _parse_object_hidden,
-                  model.TAF_OBJECT_NOT_HIDDEN: _parse_object_hidden,
-                  model.TAF_TAKE_SCREENSHOT: _parse_take_screenshot,
-                  model.TAF_VALIDATION: _parse_validation,
-                  model.TAF_WAIT: _parse_wait,
-                  model.TAF_WAIT_FOR_OBJECT: _parse_wait_for_object}
+ACTION_PARSERS = {TAC_ACTION: _parse_action,
+                  TAC_CLOSE_ALL: _parse_close_all_browser,
+                  TAC_CREATE_KEYWORD: _parse_create_keyword,
+                  TAC_DATA_ENTRY: _parse_data_entry,
+                  TAC_DATA_ENTRY_CUSTOM: _parse_data_entry,
+                  TAC_GET_OBJECT_DATA: _parse_get_object_data,
+                  TAC_LAUNCH_AUT: _parse_launch_aut,
+                  TAC_OBJECT_ENABLED: _parse_object_enabled,
+                  TAC_OBJECT_NOT_ENABLED: _parse_object_enabled,
+                  TAC_OBJECT_EXIST: _parse_object_exists,
+                  TAC_OBJECT_NOT_EXIST: _parse_object_exists,
+                  TAC_OBJECT_HIDDEN: _parse_object_hidden,
+                  TAC_OBJECT_NOT_HIDDEN: _parse_object_hidden,
+                  TAC_TAKE_SCREENSHOT: _parse_take_screenshot,
+                  TAC_VALIDATION: _parse_validation,
+                  TAC_WAIT: _parse_wait,
+                  TAC_WAIT_FOR_OBJECT: _parse_wait_for_object}
 
 
 def _parse_scenario_compare_int(parsing_context: ParsingContext,
@@ -366,9 +377,9 @@ def _parse_scenario_ui(parsing_context: ParsingContext,
     start, end = row_range
     for row_index in range(start, end):
         if parsing_context.sheet.runnable(row_index):
-            testing_action = parsing_context.sheet.action(row_index)
-            if testing_action is not None and testing_action.lower() in ACTION_PARSERS.keys():
-                new_actions = ACTION_PARSERS[testing_action.lower()](parsing_context, row_index, ui_objects_map)
+            action_parser = ACTION_PARSERS.get(parsing_context.sheet.action_code(row_index))
+            if action_parser is not None:
+                new_actions = action_parser(parsing_context, row_index, ui_objects_map)
                 if new_actions is None:
                     return None
                 if isinstance(new_actions, tuple):
@@ -376,6 +387,7 @@ def _parse_scenario_ui(parsing_context: ParsingContext,
                 else:
                     actions.append(new_actions)
             else:
+                testing_action = parsing_context.sheet.action(row_index)
                 print(f'ERROR: Unrecognized testing action {testing_action} on row {row_index + 1}', file=sys.stderr)
                 return None
     return model.UITest(tuple(actions), ui_objects_map)
@@ -391,33 +403,56 @@ def _parse_scenario(parsing_context: ParsingContext,
     :param ui_objects_map: The ui_objects map.
     :return: A Scenario object if successful or else None
     """
-    testing_action = parsing_context.sheet.action(row_range[0]).lower()
-    if testing_action == model.TAF_DATABASE_TEST:
+    testing_action = parsing_context.sheet.action_code(row_range[0])
+    if testing_action == TAC_DATABASE_TEST:
         return api_converter.parse_database_test(parsing_context, row_range[0])
-    if testing_action == model.TAF_SHARED_STEP:
+    if testing_action == TAC_SHARED_STEP:
         return api_converter.parse_shared_step(parsing_context, row_range[0])
-    if testing_action == model.TAF_WEB_SERVICE:
+    if testing_action == TAC_WEB_SERVICE:
         return api_converter.parse_api_test(parsing_context, row_range[0])
-    if testing_action == model.TAF_COMPARE_INT:
+    if testing_action == TAC_COMPARE_INT:
         return _parse_scenario_compare_int(parsing_context, row_range)
-    if testing_action == model.TAF_CREATE_KEYWORD:
+    if testing_action == TAC_CREATE_KEYWORD:
         return _parse_scenario_create_keyword(parsing_context, row_range)
     return _parse_scenario_ui(parsing_context, row_range, ui_objects_map)
 
 
-def parse_file(filename: str, ui_objects_map: dict[str, UIObject], selector: str) -> tuple[
-                                                                                         model.ScenarioSource | None] | None:
+def iter_file(filename: str, ui_objects_map: dict[str, UIObject], selector: str,
+              cache: WorkbookCache | None = None,
+              check_xml: bool = False,
+              content: bytes | None = None) -> Iterator[model.ScenarioSource | None]:
     """
-    Parses the given Excel file into a tuple of Scenarios.
+    Parses the given Excel file one Scenario at a time, as they are consumed.
     :param filename: The name of the file to parse
     :param ui_objects_map: The map of Object names to UIObject
     :param selector: The optional selector
-    :return: A tuple of Scenarios.
+    :param cache: The optional workbook cache
+    :param check_xml: True to check that the xml request bodies are well-formed
+    :param content: The optional content of the workbook, filename is then only used in messages
+    :return: An iterator of Scenarios, None for a scenario that could not be parsed.
     """
     try:
-        parsing_context = create_parsing_context(filename, selector)
-        return tuple((_parse_scenario(parsing_context, row_range, ui_objects_map)
-                      for row_range in _locate_scenarios(parsing_context.sheet)))
+        parsing_context = create_parsing_context(filename, selector, cache, check_xml, content)
+        try:
+            for row_range in _locate_scenarios(parsing_context.sheet):
+                yield _parse_scenario(parsing_context, row_range, ui_objects_map)
+        finally:
+            parsing_context.spread_sheet.close()
     except Exception as e:
         print(e, file=sys.stderr)
-        return None
+        yield None
+
+
+def parse_file(filename: str, ui_objects_map: dict[str, UIObject], selector: str,
+               cache: WorkbookCache | None = None,
+               check_xml: bool = False) -> tuple[model.ScenarioSource | None] | None:
+    """
+    Parses the given Excel file into a tuple of Scenarios.
+    :param filename: The name of the file to parse
+    :param ui_objects_map: The map of Object names to UIObject
+    :param selector: The optional selector
+    :param cache: The optional workbook cache
+    :param check_xml: True to check that the xml request bodies are well-formed
+    :return: A tuple of Scenarios.
+    """
+    return tuple(iter_file(filename, ui_objects_map, selector, cache, check_xml))
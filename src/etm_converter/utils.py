@@ -1,5 +1,8 @@
+import os
 from pathlib import Path
 
+COMPARE_CHUNK_SIZE = 1024 * 1024
+
 
 def delete_file(file_path: str) -> None:
     """
@@ -20,6 +23,42 @@ def move_file(source: str, target: str) -> None:
     Path(source).rename(target_path)
 
 
+def replace_file(source: str, target: str) -> bool:
+    """
+    Move the source file to target unless target already has the same content, in which case source is deleted.
+    Unchanged targets are thus not rewritten and keep their modification time.
+    :param source: The source file path
+    :param target: The target file path
+    :return: True if target was replaced
+    """
+    if same_content(source, target):
+        Path(source).unlink()
+        return False
+    os.replace(source, target)
+    return True
+
+
+def same_content(file_path1: str, file_path2: str) -> bool:
+    """
+    Tells if two files have the same content.
+    :param file_path1: The first file path
+    :param file_path2: The second file path
+    :return: True if both files exist and have the same content
+    """
+    try:
+        if os.path.getsize(file_path1) != os.path.getsize(file_path2):
+            return False
+        with open(file_path1, 'rb') as file1, open(file_path2, 'rb') as file2:
+            while True:
+                chunk = file1.read(COMPARE_CHUNK_SIZE)
+                if chunk != file2.read(COMPARE_CHUNK_SIZE):
+                    return False
+                if not chunk:
+                    return True
+    except FileNotFoundError:
+        return False
+
+
 def save_file(file_path: str, content: str) -> None:
     """
     Save the given content in a text file at the given path.
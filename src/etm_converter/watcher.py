@@ -0,0 +1,158 @@
+import abc
+import ctypes
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable
+
+# Seconds without any further change before the changed files are processed, so that a save is seen as one change
+WATCH_DEBOUNCE = 0.1
+POLL_INTERVAL = 1.0
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class DirectoryWatcher(abc.ABC):
+    """
+    Reports the files written or removed in a folder.
+    """
+
+    @abc.abstractmethod
+    def changes(self, timeout: float | None) -> set[str] | None:
+        """
+        Waits for files to be written or removed in the folder.
+        :param timeout: The maximum number of seconds to wait, None to wait until a file is written or removed
+        :return: The names of the written or removed files, empty if none changed before the timeout, None if changes
+        may have been missed
+        """
+        pass
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher(DirectoryWatcher):
+    """
+    Watches a folder with the Linux inotify API, through the C library.
+    """
+
+    def __init__(self, path: str, libc: ctypes.CDLL):
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(path),
+                                   IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed on {path}')
+
+    def changes(self, timeout: float | None) -> set[str] | None:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, 65536)
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            names.add(os.fsdecode(data[offset:offset + name_length].rstrip(b'\0')))
+            offset += name_length
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(DirectoryWatcher):
+    """
+    Watches a folder by comparing the modification time and size of its files every POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.snapshot = self._scan()
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+                except FileNotFoundError:
+                    pass
+        return snapshot
+
+    def changes(self, timeout: float | None) -> set[str] | None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            names = {name for name, signature in snapshot.items() if self.snapshot.get(name) != signature}
+            names.update(self.snapshot.keys() - snapshot.keys())
+            self.snapshot = snapshot
+            if names:
+                return names
+            if deadline is None:
+                time.sleep(POLL_INTERVAL)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return names
+                time.sleep(min(POLL_INTERVAL, remaining))
+
+    def close(self) -> None:
+        # Nothing to release
+        pass
+
+
+def create_directory_watcher(path: str) -> DirectoryWatcher:
+    """
+    Creates the watcher of a folder, with inotify when available or else by polling.
+    :param path: The folder path
+    :return: The folder watcher
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            return InotifyWatcher(path, libc)
+        except (AttributeError, OSError) as e:
+            print(f'WARNING: inotify is not available, polling {path} instead: {e}', file=sys.stderr)
+    return PollingWatcher(path)
+
+
+def watch_directory(path: str, on_change: Callable[[set[str] | None], None]) -> None:
+    """
+    Calls on_change with the names of the files written or removed in a folder, until interrupted.
+    The changes are debounced by WATCH_DEBOUNCE seconds so that each save of a file is processed once.
+    :param path: The folder path
+    :param on_change: Called with the names of the written or removed files, or None if changes may have been missed
+    """
+    watcher = create_directory_watcher(path)
+    print(f'Watching {path}', file=sys.stderr)
+    try:
+        while True:
+            names = watcher.changes(None)
+            while names is not None:
+                more_names = watcher.changes(WATCH_DEBOUNCE)
+                if not more_names:
+                    names = names if more_names is not None else None
+                    break
+                names |= more_names
+            on_change(names)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
@@ -0,0 +1,134 @@
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import threading
+import zlib
+from pathlib import Path
+from typing import Any
+
+CACHE_FILE_SUFFIX = '.etc'
+DEFAULT_CACHE_MAX_SIZE = 512 * 1024 * 1024
+
+
+def default_cache_dir() -> str:
+    """
+    Gets the default location of the workbook cache.
+    :return: $XDG_CACHE_HOME/etm_converter or ~/.cache/etm_converter
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'etm_converter')
+
+
+class WorkbookCache:
+    """
+    On disk cache of parsed workbooks.
+    Entries are marshalled and compressed, they are keyed by the hash of the workbook content and the loader version.
+    The least recently used entries are evicted when the total size of the cache exceeds max_size. The folder is
+    scanned on the first store, the total size is then tracked in memory and the eviction frees a quarter of max_size
+    so that the folder is not scanned again on every store.
+    """
+
+    def __init__(self, cache_dir: str, loader_version: int, max_size: int = DEFAULT_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.loader_version = loader_version
+        self.max_size = max_size
+        # The estimated total size of the entries, None until the folder is scanned
+        self._total_size = None
+        # The server stores entries from several threads
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Sent to the worker processes without the lock
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return Path(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used entries until the cache fits in 3/4 of max_size if it exceeds max_size.
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for path in Path(self.cache_dir).glob('*' + CACHE_FILE_SUFFIX):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        if total_size > self.max_size:
+            entries.sort()
+            for _, size, path in entries:
+                if total_size <= self.max_size * 3 // 4:
+                    break
+                path.unlink(True)
+                total_size -= size
+        self._total_size = total_size
+
+    def key(self, content: bytes) -> str:
+        """
+        Computes the cache key of a workbook.
+        :param content: The workbook content
+        :return: The cache key
+        """
+        digest = hashlib.sha256(f'{self.loader_version}:{marshal.version}:'.encode('ascii'))
+        digest.update(content)
+        return digest.hexdigest()
+
+    def load(self, key: str) -> Any | None:
+        """
+        Loads a cache entry and marks it as recently used.
+        :param key: The cache key
+        :return: The cached value or None if the entry does not exist or can not be read
+        """
+        path = self._path(key)
+        try:
+            value = marshal.loads(zlib.decompress(path.read_bytes()))
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f'WARNING: Discarding unreadable cache entry {path}: {e}', file=sys.stderr)
+            path.unlink(True)
+            return None
+
+    def store(self, key: str, value: Any) -> None:
+        """
+        Stores a cache entry then evicts the least recently used entries if needed.
+        :param key: The cache key
+        :param value: The value to store. It must be serializable by marshal.
+        """
+        try:
+            content = zlib.compress(marshal.dumps(value), 1)
+        except ValueError as e:
+            print(f'WARNING: Unable to store cache entry {key}: {e}', file=sys.stderr)
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(content)
+                os.replace(temp_name, self._path(key))
+            finally:
+                Path(temp_name).unlink(True)
+            with self._lock:
+                if self._total_size is not None:
+                    self._total_size += len(content)
+                if self._total_size is None or self._total_size > self.max_size:
+                    self._evict()
+        except OSError as e:
+            print(f'WARNING: Unable to store cache entry {key}: {e}', file=sys.stderr)
@@ -0,0 +1,12 @@
+import pytest
+
+from etm_converter.substitution import set_substitution_rules, BUILTIN_RULES
+
+
+@pytest.fixture
+def substitution_rules():
+    """
+    Restores the built-in substitution rules and the default cache after a test that changes them.
+    """
+    yield
+    set_substitution_rules(BUILTIN_RULES)
@@ -0,0 +1,36 @@
+import openpyxl
+
+TEST_DATA_HEADERS = ['RunType', 'Environment', 'TestCaseName', 'TestingActionFunctionality',
+                     'ObjectName1', 'Value1', 'ObjectName2', 'Value2', 'ObjectName3', 'Value3', 'ObjectName4', 'Value4',
+                     'ObjectName5', 'Value5', 'ObjectName6', 'Value6']
+
+
+def api_workbook(filename, values: list[str], unknown_action: bool = False) -> None:
+    """
+    Writes an API test workbook: a json request per value, validated against the value, and a keyword per value.
+    :param filename: The workbook file name
+    :param values: The values of the request fields, validations and keywords
+    :param unknown_action: True to add a row with an unknown testing action, the workbook can not be converted
+    """
+    workbook = openpyxl.Workbook()
+    test_data = workbook.active
+    test_data.title = 'TestData'
+    test_data.append(TEST_DATA_HEADERS)
+    names = [f'Scenario {i}' for i in range(len(values))]
+    request = workbook.create_sheet('JsonReq')
+    request.append(['Json'] + names)
+    request.append(['{'] + [''] * len(values))
+    request.append(['"name": "string",'] + values)
+    request.append(['"count": number'] + ['1'] * len(values))
+    request.append(['}'] + [''] * len(values))
+    validation = workbook.create_sheet('Val')
+    validation.append(['Expr'] + names)
+    validation.append(['Response Code'] + ['200'] * len(values))
+    validation.append(['$.name'] + values)
+    for i, value in enumerate(values):
+        test_data.append(['G', None, 'T', 'CreateKeyword', f'keyword{i}', value])
+    test_data.append(['G', 'UT1', 'T', 'XMLWebServiceTest', 'RequestSheet', 'JsonReq', 'URL', '/api/x',
+                      'RequestHeader', 'post', 'ValidationSheet', 'Val'])
+    if unknown_action:
+        test_data.append(['G', None, 'T', 'NoSuchAction', 'x', 'y'])
+    workbook.save(filename)
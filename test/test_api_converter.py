@@ -0,0 +1,76 @@
+import re
+
+import openpyxl
+import pytest
+
+from etm_converter.api_converter import _split_json_template, JsonTemplateRow, TYPE_JSON_FIELD
+from etm_converter.converter import convert_api_workbook
+
+from helpers import TEST_DATA_HEADERS
+
+
+def _substitute_json_template(json_template: str, value: str) -> str:
+    """
+    The rendering of a json template row before the templates were compiled, the reference of the compiled rows.
+    """
+    match = re.compile('([^:]*):\\s*,$').search(json_template)
+    if match:
+        return f'{match.group(1)}: {value},'
+    if 'rawstring' in json_template:
+        return json_template.replace('rawstring', value)
+    if 'string' in json_template:
+        return json_template.replace('string', value.replace('"', '\\"'))
+    if 'boolean' in json_template:
+        return json_template.replace('boolean', value)
+    last_number_index = json_template.rfind('number')
+    if last_number_index >= 0:
+        return json_template[:last_number_index] + value + json_template[last_number_index + len('number'):]
+    return json_template
+
+
+@pytest.mark.parametrize('json_template', [
+    '"name": string,', '"name": "string",', '"name": "string"', '"stringValue": "string",', '"raw": rawstring,',
+    '"raw": "rawstring string",', '"flag": boolean,', '"count": number,', '"numberOf": number', '"id": ,',
+    '"id":   ,', '"fixed": 5,', '"a": "string-string",'])
+@pytest.mark.parametrize('value', ['', 'John', 'say "hi"', 'string', 'number', '12', '\\"'])
+def test_compiled_json_template_matches_previous_rendering(json_template, value):
+    template_row = JsonTemplateRow(0, TYPE_JSON_FIELD, *_split_json_template(json_template))
+    assert template_row.fill(value) == _substitute_json_template(json_template, value)
+
+
+def _xml_workbook(filename, values: list[str]) -> None:
+    """
+    Writes an API test workbook with a xml request per value, the value being the content of the count element.
+    :param filename: The workbook file name
+    :param values: The count of each scenario, possibly malformed
+    """
+    workbook = openpyxl.Workbook()
+    test_data = workbook.active
+    test_data.title = 'TestData'
+    test_data.append(TEST_DATA_HEADERS)
+    request = workbook.create_sheet('XmlReq')
+    request.append(['XMLTagNamesStart', 'XMLTagNamesEnd'] + [f'Scenario {i}' for i in range(len(values))])
+    request.append(['<root>', None] + [None] * len(values))
+    request.append(['<name>', '</name>'] + ['John'] * len(values))
+    request.append(['<count>', '</count>'] + values)
+    request.append(['</root>', None] + [None] * len(values))
+    test_data.append(['G', 'UT1', 'T', 'XMLWebServiceTest', 'RequestSheet', 'XmlReq', 'URL', '/api/x',
+                      'RequestHeader', 'post'])
+    workbook.save(filename)
+
+
+def test_check_xml_accepts_well_formed_bodies(tmp_path, capsys):
+    filename = tmp_path / 'Xml.xlsx'
+    _xml_workbook(filename, ['1', '2'])
+    assert convert_api_workbook('Xml', filename.read_bytes(), check_xml=True) is not None
+    assert 'ERROR' not in capsys.readouterr().err
+
+
+def test_check_xml_reports_row_and_column_of_malformed_body(tmp_path, capsys):
+    filename = tmp_path / 'Xml.xlsx'
+    _xml_workbook(filename, ['1', '2</a>'])
+    assert convert_api_workbook('Xml', filename.read_bytes()) is not None
+    assert convert_api_workbook('Xml', filename.read_bytes(), check_xml=True) is None
+    # The count of the second scenario, in the fourth column, is on the fourth row
+    assert 'ERROR: Malformed xml request in sheet XmlReq on column 4 row 4: mismatched tag' \
+           in capsys.readouterr().err
@@ -0,0 +1,87 @@
+import shutil
+import sys
+import zipfile
+
+import pytest
+
+from etm_converter.api_main import api_main
+from etm_converter.archive import open_feature_output, open_workbook_input
+from etm_converter.converter import Conversion
+
+from helpers import api_workbook
+
+WORKBOOKS = {'Api1': ['John'], 'Api2': ['Jane', 'x' * 30000], 'Failed': None}
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    path = tmp_path / 'workbooks'
+    path.mkdir()
+    for name, values in WORKBOOKS.items():
+        api_workbook(path / f'{name}.xlsx', values or ['Jim'], unknown_action=values is None)
+    return path
+
+
+def _convert(monkeypatch, input_path, output_path) -> None:
+    monkeypatch.setattr(sys, 'argv', ['etcapi', '--no-cache', str(input_path), str(output_path)])
+    api_main()
+
+
+def _zip(folder, filename) -> None:
+    with zipfile.ZipFile(filename, 'w') as archive:
+        for path in sorted(folder.iterdir()):
+            if path.is_file():
+                archive.write(path, path.name)
+
+
+def _files(path) -> dict[str, bytes]:
+    if path.suffix == '.zip':
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+    return {file.name: file.read_bytes() for file in path.iterdir() if file.is_file()}
+
+
+@pytest.mark.parametrize('input_zip, output_zip', [(True, False), (False, True), (True, True)])
+def test_archives_give_the_files_of_folders(tmp_path, monkeypatch, workbooks, input_zip, output_zip):
+    shutil.copytree(workbooks, tmp_path / 'in')
+    _convert(monkeypatch, tmp_path / 'in', tmp_path / 'out')
+    expected = _files(tmp_path / 'out')
+    assert sorted(expected) == ['Api1.feature', 'Api2.feature', 'Api2.req']
+    input_path = tmp_path / 'in.zip' if input_zip else tmp_path / 'in2'
+    if input_zip:
+        _zip(workbooks, input_path)
+    else:
+        shutil.copytree(workbooks, input_path)
+    output_path = tmp_path / ('out.zip' if output_zip else 'out2')
+    _convert(monkeypatch, input_path, output_path)
+    assert _files(output_path) == expected
+    if input_zip:
+        # The input archive is left untouched
+        assert sorted(_files(input_path)) == ['Api1.xlsx', 'Api2.xlsx', 'Failed.xlsx']
+    else:
+        assert sorted(path.name for path in (input_path / 'success').iterdir()) == ['Api1.xlsx', 'Api2.xlsx']
+
+
+def test_nested_workbooks_are_skipped_with_a_warning(tmp_path, capsys, workbooks):
+    filename = tmp_path / 'in.zip'
+    _zip(workbooks, filename)
+    with zipfile.ZipFile(filename, 'a') as archive:
+        archive.write(workbooks / 'Api1.xlsx', 'nested/Api3.xlsx')
+        archive.writestr('Suite.json', '{}')
+    with open_workbook_input(str(filename)) as workbook_input:
+        assert workbook_input.names() == ['Api1.xlsx', 'Api2.xlsx', 'Failed.xlsx']
+    assert f'WARNING: Skipping nested/Api3.xlsx, only the workbooks at the root of {filename}' \
+           in capsys.readouterr().err
+
+
+def test_interrupted_archive_output_is_discarded(tmp_path):
+    filename = tmp_path / 'out.zip'
+    with open_feature_output(str(filename)) as output:
+        output.write('Api1', '.req', Conversion('Feature: Api1\n', None))
+    with pytest.raises(KeyboardInterrupt):
+        with open_feature_output(str(filename)) as output:
+            output.write('Api2', '.req', Conversion('Feature: Api2\n', 'requests'))
+            raise KeyboardInterrupt
+    # The previous archive is kept and the temporary archive is deleted
+    assert _files(filename) == {'Api1.feature': b'Feature: Api1\n'}
+    assert [path.name for path in tmp_path.iterdir()] == ['out.zip']
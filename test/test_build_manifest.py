@@ -0,0 +1,97 @@
+import json
+import os
+import sys
+
+import pytest
+
+from etm_converter import api_main as api_main_module, build_manifest
+from etm_converter.api_main import api_main
+from etm_converter.build_manifest import MANIFEST_FILENAME
+
+from helpers import api_workbook
+
+
+@pytest.fixture
+def folders(tmp_path):
+    input_path = tmp_path / 'in'
+    input_path.mkdir()
+    for name, value in (('Api1', 'John'), ('Api2', 'Jane')):
+        api_workbook(input_path / f'{name}.xlsx', [value])
+    return input_path, tmp_path / 'out'
+
+
+def _convert(monkeypatch, capsys, folders, *options: str) -> list[str]:
+    input_path, output_path = folders
+    monkeypatch.setattr(sys, 'argv', ['etcapi', '--incremental', '--no-cache', *options, str(input_path),
+                                      str(output_path)])
+    api_main()
+    return [line.split(' file ')[0] + ' ' + os.path.basename(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def _manifest(output_path) -> dict:
+    return json.loads((output_path / MANIFEST_FILENAME).read_text())['workbooks']
+
+
+def test_up_to_date_workbooks_are_skipped(monkeypatch, capsys, folders):
+    input_path, output_path = folders
+    assert _convert(monkeypatch, capsys, folders) == ['Parsing Api1.xlsx', 'Parsing Api2.xlsx']
+    assert _manifest(output_path)['Api1.xlsx']['outputs'] == ['Api1.feature']
+    assert _convert(monkeypatch, capsys, folders) == ['Up to date Api1.xlsx', 'Up to date Api2.xlsx']
+    # The workbooks stay in place
+    assert sorted(os.listdir(input_path)) == ['Api1.xlsx', 'Api2.xlsx']
+
+
+def test_changed_inputs_are_rebuilt(monkeypatch, capsys, folders):
+    input_path, output_path = folders
+    _convert(monkeypatch, capsys, folders)
+    api_workbook(input_path / 'Api2.xlsx', ['Jim'])
+    assert _convert(monkeypatch, capsys, folders) == ['Up to date Api1.xlsx', 'Parsing Api2.xlsx']
+    assert 'Jim' in (output_path / 'Api2.feature').read_text()
+    (output_path / 'Api1.feature').unlink()
+    assert _convert(monkeypatch, capsys, folders) == ['Up to date Api2.xlsx', 'Parsing Api1.xlsx']
+    # An option of the conversion is an input of every workbook
+    assert _convert(monkeypatch, capsys, folders, '--dedup-requests') == ['Parsing Api1.xlsx', 'Parsing Api2.xlsx']
+
+
+def test_unchanged_outputs_are_not_rewritten(monkeypatch, capsys, folders):
+    _, output_path = folders
+    _convert(monkeypatch, capsys, folders)
+    feature = output_path / 'Api1.feature'
+    os.utime(feature, (0, 0))
+    # Rebuilt with an option that does not change the feature of a small workbook
+    assert _convert(monkeypatch, capsys, folders, '--offload-threshold', '100000') == \
+        ['Parsing Api1.xlsx', 'Parsing Api2.xlsx']
+    assert feature.stat().st_mtime == 0
+
+
+def test_deleted_workbooks_are_dropped_from_the_manifest(monkeypatch, capsys, folders):
+    input_path, output_path = folders
+    _convert(monkeypatch, capsys, folders)
+    (input_path / 'Api2.xlsx').rename(input_path / 'Api3.xlsx')
+    assert _convert(monkeypatch, capsys, folders) == ['Up to date Api1.xlsx', 'Parsing Api3.xlsx']
+    assert sorted(_manifest(output_path)) == ['Api1.xlsx', 'Api3.xlsx']
+
+
+def test_watch_removes_the_outputs_of_deleted_workbooks(monkeypatch, capsys, folders):
+    input_path, output_path = folders
+
+    def watch_directory(path, on_change):
+        assert path == str(input_path)
+        (input_path / 'Api1.xlsx').rename(input_path / 'Api4.xlsx')
+        (input_path / 'Api2.xlsx').unlink()
+        on_change({'Api1.xlsx', 'Api2.xlsx', 'Api4.xlsx'})
+
+    monkeypatch.setattr(api_main_module, 'watch_directory', watch_directory)
+    assert _convert(monkeypatch, capsys, folders, '--watch') == \
+        ['Parsing Api1.xlsx', 'Parsing Api2.xlsx', 'Removed outputs of deleted Api1.xlsx',
+         'Removed outputs of deleted Api2.xlsx', 'Parsing Api4.xlsx']
+    assert sorted(os.listdir(output_path)) == [MANIFEST_FILENAME, 'Api4.feature']
+    assert sorted(_manifest(output_path)) == ['Api4.xlsx']
+
+
+def test_converter_is_hashed_once(monkeypatch):
+    build_manifest.converter_digest.cache_clear()
+    digest = build_manifest.converter_digest()
+    monkeypatch.setattr(build_manifest.Path, 'read_bytes', lambda _: pytest.fail('converter hashed again'))
+    assert build_manifest.build_inputs_digest('selector') == build_manifest.build_inputs_digest('selector')
+    assert build_manifest.converter_digest() == digest
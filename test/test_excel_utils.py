@@ -0,0 +1,70 @@
+import openpyxl
+from openpyxl.styles import Font
+
+from etm_converter.excel_utils import _read_sheet, load_excel
+
+
+def _read(tmp_path, rows: list[list], formatted_row: int | None = None):
+    """
+    Writes a single sheet workbook and reads the sheet back with _read_sheet.
+    :param rows: The rows of the sheet
+    :param formatted_row: The optional row of a formatted cell without value, extending the declared dimension
+    :return: The Sheet
+    """
+    filename = tmp_path / 'Sheet.xlsx'
+    workbook = openpyxl.Workbook()
+    work_sheet = workbook.active
+    work_sheet.title = 'Data'
+    for row in rows:
+        work_sheet.append(row)
+    if formatted_row is not None:
+        work_sheet.cell(formatted_row, 30).font = Font(bold=True)
+    workbook.save(filename)
+    workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    try:
+        return _read_sheet(workbook['Data'], 'Data')
+    finally:
+        workbook.close()
+
+
+def test_empty_rows_are_kept_before_data_and_dropped_after(tmp_path):
+    sheet = _read(tmp_path, [['a', ' b ', None], [], ['  ', None], ['c', None, None, None], [], [None, '']])
+    assert (sheet.rows, sheet.columns) == (4, 2)
+    assert sheet.cells == [['a', 'b'], [None, None], ['', None], ['c', None]]
+
+
+def test_empty_sheet(tmp_path):
+    sheet = _read(tmp_path, [[None, ' ']])
+    assert (sheet.cells, sheet.rows, sheet.columns) == ([], 0, 0)
+
+
+def test_declared_dimension_is_not_trusted(tmp_path, capsys):
+    sheet = _read(tmp_path, [['a', 'b'], ['c']], formatted_row=5000)
+    assert (sheet.rows, sheet.columns) == (2, 2)
+    assert sheet.cells == [['a', 'b'], ['c', None]]
+    assert 'WARNING: Sheet Data declares 5000 rows and 30 columns but contains data in 2 rows and 2 columns only' \
+           in capsys.readouterr().err
+
+
+def test_no_warning_for_a_small_margin(tmp_path, capsys):
+    _read(tmp_path, [['a', 'b'], ['c']], formatted_row=50)
+    assert 'WARNING' not in capsys.readouterr().err
+
+
+def test_sheets_are_loaded_on_demand(tmp_path, capsys):
+    filename = tmp_path / 'Lazy.xlsx'
+    workbook = openpyxl.Workbook()
+    workbook.active.title = 'TestData'
+    workbook.active.append(['a'])
+    for title in (' Used ', 'Unused', 'Archived'):
+        workbook.create_sheet(title).append([title])
+    workbook.save(filename)
+    spreadsheet = load_excel(str(filename))
+    assert spreadsheet.sheet_names() == ('TestData', 'Used', 'Unused', 'Archived')
+    assert spreadsheet.unloaded_sheets() == 4
+    sheet = spreadsheet.sheet('Used')
+    assert sheet.cells == [['Used']]
+    assert spreadsheet.sheet('Used') is sheet
+    assert spreadsheet.unloaded_sheets() == 3
+    spreadsheet.close()
+    assert 'Sheets loaded: 1, never loaded: 3' in capsys.readouterr().err
@@ -0,0 +1,128 @@
+import json
+
+from etm_converter import generator
+from etm_converter.api_converter import iter_file
+from etm_converter.converter import convert_api_workbook
+from etm_converter.generator import generate_feature, save_feature, DefaultFeatureGenerator, SAPIFeatureGenerator
+from etm_converter.model import _remove_duplicates, APIScenario, APITest, RESPONSE_BODY_REGEXP
+
+from helpers import api_workbook
+
+BODY = '{"name": "' + 'x' * 100 + '"}'
+VARIABLES = (('$.id', 'id'), ('$.name', 'name'))
+OUTPUTS = (('Response Code', '200'), ('$.name', 'x' * 100), ('Response Body', '{}'))
+SUITE = {'1': {'title': 'Converted', 'tags': ['smoke']}, '2': {'title': 'Failed', 'tags': []},
+         '3': {'title': 'Missing', 'tags': []}}
+
+
+def _feature_generator(tmp_path) -> SAPIFeatureGenerator:
+    return SAPIFeatureGenerator(str(tmp_path), json.dumps(SUITE))
+
+
+def test_failed_workbook_is_not_marked_used(tmp_path):
+    feature_generator = _feature_generator(tmp_path)
+    for name, unknown_action in (('Converted', False), ('Failed', True)):
+        filename = tmp_path / f'{name}.xlsx'
+        api_workbook(filename, ['John'], unknown_action)
+        converted = save_feature(str(tmp_path / f'{name}.feature'), str(tmp_path / f'{name}.req'), name,
+                                 iter_file(str(filename), None, None, False), feature_generator)
+        assert converted != unknown_action
+    assert feature_generator.unused_test_cases == {'2': 'Failed', '3': 'Missing'}
+    assert not (tmp_path / 'Failed.feature').exists()
+
+
+def test_failed_conversion_is_not_marked_used(tmp_path):
+    feature_generator = _feature_generator(tmp_path)
+    filename = tmp_path / 'Failed.xlsx'
+    api_workbook(filename, ['John'], unknown_action=True)
+    assert convert_api_workbook('Failed', filename.read_bytes(), feature_generator=feature_generator) is None
+    api_workbook(filename, ['John'])
+    conversion = convert_api_workbook('Converted', filename.read_bytes(), feature_generator=feature_generator)
+    assert conversion.feature.startswith('@smoke\nFeature: Converted\n')
+    assert feature_generator.unused_test_cases == {'2': 'Failed', '3': 'Missing'}
+
+
+def test_scenarios_are_numbered_in_feature_order(tmp_path):
+    filename = tmp_path / 'Numbered.xlsx'
+    api_workbook(filename, ['John', 'Scenario: x'])
+    feature = convert_api_workbook('Numbered', filename.read_bytes()).feature
+    titles = [line for line in feature.split('\n') if line.startswith('Scenario: ')]
+    assert titles == ['Scenario: 0001_CreateKeywordScenario', 'Scenario: 0002_CreateKeywordScenario',
+                      'Scenario: 0003_03_scenario_0', 'Scenario: 0004_03_scenario_1']
+    # A value looking like a title is not renumbered
+    assert 'with value "Scenario: x" in variable' in feature
+    assert '"name": "Scenario: x",' in feature
+
+
+def _api_test() -> APITest:
+    # The same body, variable set and validation set in every scenario but the last one
+    scenarios = [APIScenario(f'Scenario {i}', OUTPUTS, BODY, 'header', 'post', '200', '/api/x', VARIABLES)
+                 for i in range(3)]
+    scenarios.append(APIScenario('Other', (('$.id', '1'),), '{}', 'header', 'post', '200', '/api/x', (('$.x', 'x'),)))
+    scenarios.append(APIScenario('Get', None, '', 'header', 'get', '200', '/api/x', None))
+    return APITest(tuple(scenarios))
+
+
+def _baseline_requests(api_test: APITest) -> str:
+    # The request file written before the deduplicated mode
+    data = []
+    for scenario in api_test.scenarios:
+        if scenario.request_type != 'get':
+            data.extend([f'##KEY:##REQUEST:{scenario.name}', scenario.request])
+        if scenario.variables:
+            data.append(f'##KEY:##STORE:{scenario.name}')
+            for expression, variable in scenario.variables:
+                data.extend([f'Path:{expression}', variable])
+        if scenario.outputs:
+            validations = []
+            for expression, value in scenario.outputs:
+                if not RESPONSE_BODY_REGEXP.search(expression.lower()):
+                    validations.extend([f'Path:{expression}', _remove_duplicates(value)])
+            if validations:
+                data.append(f'##KEY:##VALIDATE:{scenario.name}')
+                data.extend(validations)
+    return '\n'.join(data)
+
+
+def _resolve(requests: str) -> str:
+    # Replaces the references of a deduplicated request file by their payloads
+    blobs = {}
+    lines = []
+    blob = None
+    for line in requests.split('\n'):
+        if line.startswith('##BLOB:'):
+            blob = blobs[line[7:]] = []
+        elif line.startswith('##KEY:'):
+            blob = None
+            lines.append(line)
+        elif line.startswith('##REF:'):
+            lines.extend(blobs[line[6:]])
+        elif blob is not None:
+            blob.append(line)
+        else:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def test_requests_without_dedup_are_unchanged(monkeypatch):
+    monkeypatch.setattr(generator, 'REQUESTS_MAX_SIZE', 0)
+    api_test = _api_test()
+    _, requests = generate_feature('Api', [api_test], DefaultFeatureGenerator())
+    assert requests == _baseline_requests(api_test)
+
+
+def test_repeated_payloads_are_written_once(monkeypatch):
+    monkeypatch.setattr(generator, 'REQUESTS_MAX_SIZE', 0)
+    api_test = _api_test()
+    feature, requests = generate_feature('Api', [api_test], DefaultFeatureGenerator())
+    dedup_feature, dedup_requests = generate_feature('Api', [api_test], DefaultFeatureGenerator(), dedup_requests=True)
+    assert dedup_feature == feature
+    assert _resolve(dedup_requests) == requests
+    lines = dedup_requests.split('\n')
+    assert lines.count(BODY) == 1
+    assert lines.count('Path:$.name') == 2
+    assert lines.count('Path:Response Code') == 1
+    assert lines.count('##KEY:##STORE:Scenario 2') == 1
+    # A body, a variable set and a validation set shared by the first scenarios, then those of Other
+    assert len([line for line in lines if line.startswith('##BLOB:')]) == 6
+    assert len([line for line in lines if line.startswith('##REF:')]) == 12
@@ -0,0 +1,70 @@
+import itertools
+
+import pytest
+
+from etm_converter.model import _remove_duplicates, scenario_title, APIScenario, APITest
+
+OUTPUTS = (('Response Code', '200'), ('$.name', 'x' * 50), ('Response Body', 'y' * 500))
+VARIABLES = (('$.id', 'i' * 20),)
+
+
+def _scenario(request: str = 'r' * 100) -> APIScenario:
+    return APIScenario('Scenario', OUTPUTS, request, 'header', 'json', '200', '/api/x', VARIABLES)
+
+
+def test_sizes_are_computed_at_construction():
+    scenario = _scenario()
+    assert scenario.validation_values == ('200', 'xx', None)
+    assert scenario.variable_length == 24
+    # The response body is not part of the validation set
+    assert scenario.validation_length == len('Response Code200') + len('$.name') + 50
+
+
+def test_scenario_title():
+    assert scenario_title(7, 'Login') == 'Scenario: 0007_Login'
+    assert scenario_title(12345, 'Login') == 'Scenario: 12345_Login'
+
+
+def test_api_scenarios_are_numbered_from_the_given_number():
+    scenarios = APITest((_scenario(), _scenario('Scenario: not a title'))).api_scenarios(1000, 9)
+    assert [scenario.split('\n')[0] for scenario in scenarios] == ['Scenario: 0009_Scenario', 'Scenario: 0010_Scenario']
+    assert '"""\nScenario: not a title\n"""' in scenarios[1]
+
+
+@pytest.mark.parametrize('offload_threshold, offloaded', [
+    (10, (True, True, True)), (30, (True, False, True)), (80, (True, False, False)), (100, (False, False, False))])
+def test_offloaded_request_data(offload_threshold, offloaded):
+    scenario = _scenario()
+    entries = dict(scenario.request_entries(offload_threshold))
+    assert ('##REQUEST:Scenario' in entries, '##STORE:Scenario' in entries,
+            '##VALIDATE:Scenario' in entries) == offloaded
+    assert ('request "Scenario"' in scenario.scenario(offload_threshold, 1)) == offloaded[0]
+
+
+def _previous_remove_duplicates(input_str: str) -> str:
+    """
+    The implementation of _remove_duplicates trying every repetition count, the reference of the minimal period one.
+    """
+    if input_str:
+        input_length = len(input_str)
+        if input_length > 10:
+            for rep in range(input_length // 2, 1, -1):
+                if input_length % rep == 0:
+                    substring = input_str[:input_length // rep]
+                    if substring * rep == input_str:
+                        return substring
+    return input_str
+
+
+@pytest.mark.parametrize('value', [
+    None, '', 'a', 'ab', 'x' * 10, 'x' * 11, 'x' * 12, 'x' * 13, 'x' * 49, 'x' * 50, 'ab' * 6, 'abc' * 7,
+    'ab' * 5 + 'a', 'abcab' * 3, '12.5' * 4, 'abcdefghijkl', 'aab' * 4 + 'a', 'Response Code'])
+def test_remove_duplicates_matches_previous_implementation(value):
+    assert _remove_duplicates(value) == _previous_remove_duplicates(value)
+
+
+def test_remove_duplicates_matches_previous_implementation_exhaustively():
+    for length in range(11, 17):
+        for letters in itertools.product('ab', repeat=length):
+            value = ''.join(letters)
+            assert _remove_duplicates(value) == _previous_remove_duplicates(value), value
@@ -0,0 +1,81 @@
+from typing import Iterable
+
+import pytest
+
+from etm_converter import generator, request_reader
+from etm_converter.generator import IndexedRequestWriter
+from etm_converter.request_reader import RequestReader
+
+PAYLOADS = {f'##REQUEST:Scenario {i}': (f'{{"id": {i}, "name": "é{i}"}}', 'second line') for i in range(100)}
+PAYLOADS.update({'##STORE:Scenario 0': ('$.id', 'id'), '##VALIDATE:Scenario 0': (), '##REQUEST:Ünïcode': ('✓',)})
+
+
+def _write(filename, payloads: Iterable[tuple[str, tuple[str, ...]]], dedup_requests: bool = False) -> None:
+    requests = IndexedRequestWriter(dedup_requests)
+    try:
+        for key, payload in payloads:
+            requests.add(key, payload)
+        with open(filename, 'wb') as file:
+            requests.finish(file)
+    finally:
+        requests.data_file.close()
+
+
+@pytest.mark.parametrize('dedup_requests', [False, True])
+def test_every_key_is_read_back(tmp_path, dedup_requests):
+    filename = tmp_path / 'Api.reqx'
+    _write(filename, PAYLOADS.items(), dedup_requests)
+    with RequestReader(str(filename)) as reader:
+        assert len(reader) == len(PAYLOADS)
+        for key, payload in PAYLOADS.items():
+            assert reader.get(key) == '\n'.join(payload)
+            assert key in reader
+
+
+def test_missing_key(tmp_path):
+    filename = tmp_path / 'Api.reqx'
+    _write(filename, PAYLOADS.items())
+    with RequestReader(str(filename)) as reader:
+        assert reader.get('##REQUEST:Scenario 100') is None
+        assert '##REQUEST:' not in reader
+
+
+def test_empty_file(tmp_path):
+    filename = tmp_path / 'Api.reqx'
+    _write(filename, [])
+    with RequestReader(str(filename)) as reader:
+        assert len(reader) == 0
+        assert reader.get('##REQUEST:Scenario 0') is None
+
+
+def test_hash_collisions(tmp_path, monkeypatch):
+    # Every key has the same hash, the keys are told apart on the probe sequence
+    for module in (generator, request_reader):
+        monkeypatch.setattr(module, 'key_hash', lambda key: 7)
+    filename = tmp_path / 'Api.reqx'
+    payloads = dict(list(PAYLOADS.items())[:20])
+    _write(filename, payloads.items())
+    with RequestReader(str(filename)) as reader:
+        for key, payload in payloads.items():
+            assert reader.get(key) == '\n'.join(payload)
+        assert reader.get('##REQUEST:Scenario 99') is None
+
+
+def test_last_payload_wins_and_repeated_payloads_are_written_once(tmp_path):
+    payloads = [(f'##REQUEST:Scenario {i}', ('x' * 1000,)) for i in range(10)] + [('##REQUEST:Scenario 0', ('y',))]
+    sizes = {}
+    for dedup_requests in (False, True):
+        filename = tmp_path / f'Api{dedup_requests}.reqx'
+        _write(filename, payloads, dedup_requests)
+        sizes[dedup_requests] = filename.stat().st_size
+        with RequestReader(str(filename)) as reader:
+            assert reader.get('##REQUEST:Scenario 0') == 'y'
+            assert reader.get('##REQUEST:Scenario 9') == 'x' * 1000
+    assert sizes[True] < sizes[False] - 8000
+
+
+def test_not_an_indexed_file(tmp_path):
+    filename = tmp_path / 'Api.req'
+    filename.write_text('##REQUEST:Scenario 0\n{}\n' + ' ' * 100)
+    with pytest.raises(ValueError):
+        RequestReader(str(filename))
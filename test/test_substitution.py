@@ -0,0 +1,63 @@
+import pytest
+
+from etm_converter.converter import convert_api_workbook
+from etm_converter.substitution import set_substitution_rules, substitute_value, substitution_statistics, \
+    BUILTIN_RULES, DEFAULT_SUBSTITUTION_CACHE_ENTRIES, MAX_MEMOISED_VALUE_LENGTH
+
+from helpers import api_workbook
+
+# Random and time based expressions are substituted by tokens evaluated when the tests run
+TOKEN_VALUES = {
+    '~csharp(Guid.NewGuid().ToString())': '~guid',
+    '~csharp( "Guid.NewGuid().ToString()" )': '~guid',
+    '~csharp(DateTime.Now.AddDays(3).AddYears(-1).ToString("MM/dd/yyyy"))': '~now-1y+3d{MM/dd/yyyy}',
+    '~csharp(DateTime.Today.ToString("yyyy"))': '~now{yyyy}',
+    '~csharp(return string.Format("201275{0}", new Random().Next(1000, 9999));)': '201275~random{1000}',
+}
+VALUES = list(TOKEN_VALUES) + [
+    'TEXT(NOW(),"mm")', '~csharp("{abc}".Substring(2))', '~csharp( "{abc}".substring( 2 , 5 ))', '~string("hello")',
+    '~STRING("a"b")', '~csharp(CultureInfo.CurrentCulture.TextInfo.ToTitleCase("{name}"))', '~email', '~EMAIL',
+    '~email ', 'abc~email', '~csharp(Guid.NewGuid()x', 'substring(', 'John', '12345', '{id}', 'x' * 1000,
+    '~string("' + 'x' * MAX_MEMOISED_VALUE_LENGTH + '")']
+
+
+def _substitute_all(cache_size: int) -> list[str | None]:
+    set_substitution_rules(BUILTIN_RULES, cache_size)
+    # Twice so that the second pass is served by the memo
+    return [substitute_value(value) for value in VALUES + [None] + VALUES + [None]]
+
+
+def test_cache_does_not_change_the_substituted_values(substitution_rules):
+    assert _substitute_all(0) == _substitute_all(DEFAULT_SUBSTITUTION_CACHE_ENTRIES)
+    assert substitution_statistics().hits > 0
+
+
+@pytest.mark.parametrize('value, token', TOKEN_VALUES.items())
+def test_random_and_time_values_are_tokens(substitution_rules, value, token):
+    set_substitution_rules(BUILTIN_RULES, DEFAULT_SUBSTITUTION_CACHE_ENTRIES)
+    # The memo only ever holds the token, the random or time value is computed by each test run
+    assert substitute_value(value) == token
+    assert substitute_value(value) == token
+
+
+def test_plain_and_long_values_are_not_memoised(substitution_rules):
+    set_substitution_rules(BUILTIN_RULES, DEFAULT_SUBSTITUTION_CACHE_ENTRIES)
+    long_value = '~string("' + 'x' * MAX_MEMOISED_VALUE_LENGTH + '")'
+    for _ in range(2):
+        assert substitute_value('John') == 'John'
+        assert substitute_value(long_value) == 'x' * MAX_MEMOISED_VALUE_LENGTH
+    statistics = substitution_statistics()
+    assert (statistics.hits, statistics.misses) == (0, 0)
+
+
+def test_cache_does_not_change_the_feature(tmp_path, substitution_rules):
+    filename = tmp_path / 'Api.xlsx'
+    api_workbook(filename, VALUES)
+    conversions = []
+    for cache_size in (0, DEFAULT_SUBSTITUTION_CACHE_ENTRIES):
+        set_substitution_rules(BUILTIN_RULES, cache_size)
+        conversions.append(convert_api_workbook('Api', filename.read_bytes()))
+    assert conversions[0] is not None
+    assert conversions[0] == conversions[1]
+    for token in set(TOKEN_VALUES.values()):
+        assert token in conversions[0].feature + (conversions[0].requests or '')
@@ -0,0 +1,77 @@
+import ctypes
+import os
+import sys
+
+import pytest
+
+from etm_converter import watcher
+from etm_converter.watcher import InotifyWatcher, PollingWatcher, IN_CLOSE_WRITE, IN_DELETE, IN_MOVED_FROM, \
+    IN_MOVED_TO, IN_Q_OVERFLOW, INOTIFY_EVENT
+
+
+def _event(mask: int, name: str) -> bytes:
+    # The name is terminated and padded with NUL bytes, as the kernel aligns the events
+    encoded_name = name.encode('UTF-8')
+    encoded_name = encoded_name.ljust((len(encoded_name) // 16 + 1) * 16, b'\0') if name else b''
+    return INOTIFY_EVENT.pack(1, mask, 0, len(encoded_name)) + encoded_name
+
+
+@pytest.fixture
+def pipe_watcher():
+    """
+    An InotifyWatcher reading the events written in a pipe, to test their parsing on any platform.
+    """
+    read_fd, write_fd = os.pipe()
+    pipe_watcher = InotifyWatcher.__new__(InotifyWatcher)
+    pipe_watcher.fd = read_fd
+    yield pipe_watcher, write_fd
+    pipe_watcher.close()
+    os.close(write_fd)
+
+
+def test_inotify_events_are_parsed(pipe_watcher):
+    pipe_watcher, write_fd = pipe_watcher
+    assert pipe_watcher.changes(0) == set()
+    os.write(write_fd, _event(IN_CLOSE_WRITE, 'Api1.xlsx') + _event(IN_MOVED_TO, 'Api2.xlsx')
+             + _event(IN_DELETE, 'Api3.xlsx') + _event(IN_MOVED_FROM, 'A long workbook name.xlsx')
+             + _event(IN_CLOSE_WRITE, 'Api1.xlsx'))
+    assert pipe_watcher.changes(0) == {'Api1.xlsx', 'Api2.xlsx', 'Api3.xlsx', 'A long workbook name.xlsx'}
+
+
+def test_inotify_overflow_reports_missed_changes(pipe_watcher):
+    pipe_watcher, write_fd = pipe_watcher
+    os.write(write_fd, _event(IN_CLOSE_WRITE, 'Api1.xlsx') + _event(IN_Q_OVERFLOW, ''))
+    assert pipe_watcher.changes(0) is None
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is only available on Linux')
+def test_inotify_reports_written_and_removed_files(tmp_path):
+    input_path = tmp_path / 'in'
+    input_path.mkdir()
+    inotify_watcher = InotifyWatcher(str(input_path), ctypes.CDLL(None, use_errno=True))
+    try:
+        (input_path / 'Api1.xlsx').write_bytes(b'1')
+        (input_path / 'Api2.xlsx.tmp').write_bytes(b'2')
+        (input_path / 'Api2.xlsx.tmp').rename(input_path / 'Api2.xlsx')
+        assert inotify_watcher.changes(1) == {'Api1.xlsx', 'Api2.xlsx.tmp', 'Api2.xlsx'}
+        (input_path / 'Api1.xlsx').unlink()
+        (input_path / 'Api2.xlsx').rename(tmp_path / 'Api2.xlsx')
+        assert inotify_watcher.changes(1) == {'Api1.xlsx', 'Api2.xlsx'}
+        assert inotify_watcher.changes(0) == set()
+    finally:
+        inotify_watcher.close()
+
+
+def test_polling_reports_written_and_removed_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(watcher, 'POLL_INTERVAL', 0.01)
+    (tmp_path / 'Api1.xlsx').write_bytes(b'1')
+    (tmp_path / 'folder').mkdir()
+    polling_watcher = PollingWatcher(str(tmp_path))
+    assert polling_watcher.changes(0) == set()
+    (tmp_path / 'Api2.xlsx').write_bytes(b'2')
+    (tmp_path / 'Api1.xlsx').write_bytes(b'11')
+    assert polling_watcher.changes(0.1) == {'Api1.xlsx', 'Api2.xlsx'}
+    assert polling_watcher.changes(0.05) == set()
+    (tmp_path / 'Api2.xlsx').unlink()
+    os.utime(tmp_path / 'Api1.xlsx', ns=(0, 0))
+    assert polling_watcher.changes(None) == {'Api1.xlsx', 'Api2.xlsx'}
@@ -0,0 +1,46 @@
+import os
+import pickle
+import time
+
+from etm_converter.workbook_cache import WorkbookCache, CACHE_FILE_SUFFIX
+
+
+def test_store_and_load(tmp_path):
+    cache = WorkbookCache(str(tmp_path), 1)
+    key = cache.key(b'workbook')
+    assert cache.load(key) is None
+    cache.store(key, {'Sheet': [('a', 1, None)]})
+    assert cache.load(key) == {'Sheet': [('a', 1, None)]}
+    assert cache.key(b'workbook') != WorkbookCache(str(tmp_path), 2).key(b'workbook')
+
+
+def test_unmarshallable_value_is_not_stored(tmp_path, capsys):
+    cache = WorkbookCache(str(tmp_path), 1)
+    key = cache.key(b'workbook')
+    cache.store(key, object())
+    assert 'WARNING: Unable to store cache entry' in capsys.readouterr().err
+    assert cache.load(key) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = WorkbookCache(str(tmp_path), 1, max_size=4000)
+    keys = [cache.key(bytes([i])) for i in range(10)]
+    for i, key in enumerate(keys):
+        cache.store(key, os.urandom(1000))
+        # Distinct modification times in the past, the entry being stored is the most recently used one
+        os.utime(tmp_path / (key + CACHE_FILE_SUFFIX), (time.time() - 100 + i, time.time() - 100 + i))
+    entries = sorted(tmp_path.glob('*' + CACHE_FILE_SUFFIX), key=os.path.getmtime)
+    assert sum(entry.stat().st_size for entry in entries) <= 4000
+    assert entries[-1].name == keys[-1] + CACHE_FILE_SUFFIX
+    assert cache.load(keys[0]) is None
+
+
+def test_cache_is_sent_to_the_workers(tmp_path):
+    cache = WorkbookCache(str(tmp_path), 1)
+    key = cache.key(b'workbook')
+    cache.store(key, 'value')
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.load(key) == 'value'
+    copy.store(copy.key(b'other'), 'other')
+    assert cache.load(cache.key(b'other')) == 'other'